@@ -1,10 +1,46 @@
 import pygame
 import torch
+import torch.nn.functional as F
 import numpy as np
 import os
 import math
 
-from policy_network import PolicyNetwork
+from policy_network import PolicyNetwork, ConvPolicyNetwork, StaticInputCache
+from rollout_buffer import RolloutBuffer
+from checkpoint import load_checkpoint, save_atomically
+
+
+def decide_actions(agents):
+	# Decide for every agent with a pending observation (from any game hosted in this process):
+	# one forward pass per distinct policy network and vectorized sampling.
+	groups = {}
+	for agent in agents:
+		groups.setdefault(id(agent.policy_net), []).append(agent)
+
+	with torch.inference_mode():
+		for group in groups.values():
+			observations = torch.stack([agent.pending_observation for agent in group])
+			probs, values = policy_outputs(group, observations)
+			actions = sample_actions(probs, [agent.game.round_rng.random() for agent in group])
+			log_probs = probs.gather(1, actions).log()
+			for agent, action, log_prob, value in zip(group, actions.flatten().tolist(), log_probs.flatten().tolist(), values.tolist()):
+				agent.apply_decision(action, log_prob, value)
+
+
+def sample_actions(probs, uniforms):
+	# Inverse-CDF sampling with one uniform per row, drawn from each agent's own game RNG,
+	# so a seeded game samples the same actions however the batch is put together
+	uniforms = torch.tensor(uniforms, dtype=probs.dtype).unsqueeze(1)
+	actions = (probs.cumsum(1) < uniforms).sum(1, keepdim=True)
+	return actions.clamp_max(probs.shape[1] - 1)
+
+
+def policy_outputs(agents, observations):
+	# (probabilities, values); agents share one network, go through their static-input caches when they all have one
+	caches = [agent.static_cache for agent in agents]
+	if all(caches):
+		return StaticInputCache.forward_batch(caches, observations)
+	return agents[0].policy_net.forward_with_value(observations)
 
 
 class Agent:
@@ -13,158 +49,113 @@ class Agent:
 		self.agent_id = agent_id
 		self.tank = None
 		self.opponent = None
-		self.previous_state = None
+		self.previous_distance = None
+		self.pending_observation = None  # Observation waiting for decide_actions
+		self.decided_this_frame = None  # Set by prepare_update, None once the round was reset
+		self.done = False
 		self.current_action = None
+		self.current_log_prob = None
+		self.current_value = None
 		self.current_keys = None
 		self.cycle_counter = 0  # Add a cycle counter
 		self.decision_interval = 4  # Number of cycles between decisions
 
 		# Agent PPO Variables
-		self.memory = []  # Store (state, action, reward, next_state, done)
+		self.memory = None  # RolloutBuffer, created with the network
 		self.action_dim = action_dim
 		self.input_dim = None
 		self.policy_net = None
-		self.optimizer = None
+		self.static_cache = None
+		self.optimizer = None  # Created on the first train(), see get_optimizer
+		self.learning_rate = None
+		self.shared_agent = None
 		self.gamma = 0.99
-
-		# Feature Variables
-		self.max_bricks = len(self.game.map.bricks)
-		self.max_steel_walls = len(self.game.map.steel_walls)
-		self.max_bullets = 50
-		self.max_eagles = 2
+		self.gae_lambda = 0.95
+		self.value_coef = 0.5
+		self.ppo_epochs = 4
+		self.target_kl = 0.02  # Stop an update early once the approximate KL passes this
 
 		# Add itself to agent list
 		self.game.agents.append(self)
 
+	def reset(self):
+		# Clear per-round decision state, the network, optimizer and memory carry over
+		if self.memory is not None:
+			self.memory.end_episode()
+		self.previous_distance = None
+		self.pending_observation = None
+		self.decided_this_frame = None
+		self.done = False
+		self.current_action = None
+		self.current_log_prob = None
+		self.current_value = None
+		self.current_keys = None
+		self.cycle_counter = 0
+
 	def save_model(self, filename):
-		torch.save(self.policy_net.state_dict(), filename)
+		save_atomically(self.policy_net.state_dict(), filename)
 
 	def load_model(self, filename):
-		self.policy_net.load_state_dict(torch.load(filename))
+		self.load_state(load_checkpoint(filename))
+
+	def load_state(self, state_dict):
+		# strict=False: checkpoints from before the value head only lack its weights
+		self.policy_net.load_state_dict(state_dict, strict=False)
 		self.policy_net.eval()
 
-	def setup_model(self, lr=0.001, model_filename=None):
-		tank_features = (19 + (50 * 2)) * 2  # 19 attributes + bullet attributes (50*2) per tank
-		eagle_features = 3 * self.max_eagles  # 3 attributes per eagle
-		brick_features = 3 * self.max_bricks  # 3 attributes per brick
-		steel_wall_features = 2 * self.max_steel_walls  # 2 attributes per steel_wall
+	def setup_model(self, lr=0.001, model_filename=None, shared_agent=None):
+		# At most one transition per decision, and decisions are at least two frames apart
+		capacity = self.game.rounds_per_train * self.game.max_time * self.game.FPS
+		self.memory = RolloutBuffer(capacity, self.game.encoder.size)
+
+		if shared_agent:
+			# Another game in this process owns the network and optimizer, only the static cache is per game
+			self.input_dim = shared_agent.input_dim
+			self.policy_net = shared_agent.policy_net
+			self.shared_agent = shared_agent
+			if shared_agent.static_cache:
+				self.static_cache = StaticInputCache(self.policy_net, self.game.encoder)
+			return
 
-		self.input_dim = tank_features + eagle_features + brick_features + steel_wall_features
-		self.policy_net = PolicyNetwork(self.input_dim, self.action_dim)
-		self.optimizer = torch.optim.Adam(self.policy_net.parameters(), lr)
+		encoder = self.game.encoder
+		self.input_dim = encoder.size
+		with torch.random.fork_rng():
+			torch.manual_seed(self.game.rng.getrandbits(63))  # Initial weights follow the game's seed
+			if self.game.observation_mode == "planes":
+				# Tile planes + scalars, same size on every stage
+				self.policy_net = ConvPolicyNetwork(encoder.num_planes, encoder.num_scalars, self.action_dim)
+				self.static_cache = None
+			else:
+				# (19 + 50 bullets * 2) per tank, 3 per eagle, 3 per brick, 2 per steel wall (see ObservationEncoder)
+				self.policy_net = PolicyNetwork(self.input_dim, self.action_dim)
+				self.static_cache = StaticInputCache(self.policy_net, encoder)
+		self.learning_rate = lr
 		self.gamma = 0.99
 
 		if model_filename and os.path.exists(model_filename):
 			self.load_model(model_filename)
 
-	def preprocess_state(self, state):
-		# Flatten the game state
-		tank1_state = state["tank1"]
-		tank2_state = state["tank2"]
-		eagles = state["eagles"]
-		bricks = state["bricks"]
-		steel_walls = state["steel_walls"]
-		timeElapsed = state["timeElapsed"]
-
-		tank1_features = [
-			tank1_state["x_norm"],
-			tank1_state["y_norm"],
-			tank1_state["rel_dx"],
-			tank1_state["rel_dy"],
-			int(tank1_state["direction"] == "UP"),
-			int(tank1_state["direction"] == "DOWN"),
-			int(tank1_state["direction"] == "LEFT"),
-			int(tank1_state["direction"] == "RIGHT"),
-			tank1_state["distance_to_tank2"],
-			*tank1_state["direction_to_opponent"],
-			int(tank1_state["destroyed"]),
-			tank1_state["has_line_of_sight"],
-		]
-		tank1_bullet_features = []
-		for bullet in self.game.tank1.bullets:
-			tank1_bullet_features.append(bullet.x / self.game.SCREEN_WIDTH)
-			tank1_bullet_features.append(bullet.y / self.game.SCREEN_HEIGHT)
-		while len(tank1_bullet_features) < self.max_bullets * 2:  # 2 attributes per bullet (x, y)
-			tank1_bullet_features.append(0)  # Pad with 0 if fewer bullets exist
-		tank2_features = [
-			tank2_state["x_norm"],
-			tank2_state["y_norm"],
-			tank2_state["rel_dx"],
-			tank2_state["rel_dy"],
-			int(tank2_state["direction"] == "UP"),
-			int(tank2_state["direction"] == "DOWN"),
-			int(tank2_state["direction"] == "LEFT"),
-			int(tank2_state["direction"] == "RIGHT"),
-			tank2_state["distance_to_tank1"],
-			*tank2_state["direction_to_opponent"],
-			int(tank2_state["destroyed"]),
-			tank2_state["has_line_of_sight"],
-		]
-		tank2_bullet_features = []
-		for bullet in self.game.tank2.bullets:
-			tank2_bullet_features.append(bullet.x / self.game.SCREEN_WIDTH)
-			tank2_bullet_features.append(bullet.y / self.game.SCREEN_HEIGHT)
-		while len(tank2_bullet_features) < self.max_bullets * 2:  # 2 attributes per bullet (x, y)
-			tank2_bullet_features.append(0)  # Pad with 0 if fewer bullets exist
-
-		# Eagle features
-		eagle_features = []
-		for eagle in eagles:
-			eagle_features.append(eagle["x"] / self.game.SCREEN_WIDTH)
-			eagle_features.append(eagle["y"] / self.game.SCREEN_HEIGHT)
-			eagle_features.append(int(eagle["destroyed"]))
-		while len(eagle_features) < self.max_eagles * 3:  # 3 attributes per eagle (x, y, destroyed)
-			eagle_features.append(0)  # Pad with 0 if fewer eagles exist
-
-		# Brick features
-		brick_features = []
-		for brick in bricks:
-			brick_features.append(brick["x"] / self.game.SCREEN_WIDTH)
-			brick_features.append(brick["y"] / self.game.SCREEN_HEIGHT)
-			brick_features.append(int(brick["destroyed"]))
-		while len(brick_features) < self.max_bricks * 3:
-			brick_features.append(0)  # Pad with 0 if fewer bricks exist
-
-		# Steel wall features
-		steel_wall_features = []
-		for wall in steel_walls:
-			steel_wall_features.append(wall["x"] / self.game.SCREEN_WIDTH)
-			steel_wall_features.append(wall["y"] / self.game.SCREEN_HEIGHT)
-		while len(steel_wall_features) < self.max_steel_walls * 2:
-			steel_wall_features.append(0)  # Pad with 0 if fewer steel walls exist
-
-		# Combine all features
-		flat_state = (
-			tank1_features +
-			tank1_bullet_features +
-			tank2_features +
-			tank2_bullet_features +
-			eagle_features +
-			brick_features +
-			steel_wall_features +
-			[timeElapsed]
-		)
-
-		state_tensor = torch.FloatTensor(flat_state[:self.input_dim])
-		# print(f"State tensor shape: {state_tensor.shape}")
-		return state_tensor
-
-	def decide_action(self, state):
-		state_tensor = self.preprocess_state(state).unsqueeze(0)
-		action_probs = self.policy_net(state_tensor).detach().numpy().flatten()
-
-		# Validate probabilities
-		if not np.isclose(np.sum(action_probs), 1.0):
-			raise ValueError(f"Action probabilities do not sum to 1: {action_probs}")
-
-		# Sample an action based on probabilities
-		action = np.random.choice(len(action_probs), p=action_probs)
-
-		return action
+	def get_optimizer(self):
+		# Built lazily: constructing the first torch optimizer imports torch._dynamo, seconds of startup
+		if self.shared_agent:
+			return self.shared_agent.get_optimizer()
+		if self.optimizer is None:
+			self.optimizer = torch.optim.Adam(self.policy_net.parameters(), self.learning_rate)
+		return self.optimizer
+
+	def get_observation(self):
+		# Shares memory with the game's encoder buffer (no copy), valid until the next encode
+		return torch.from_numpy(self.game.encoder.encode())
+
+	def decide_action(self, observation):
+		# Single observation; the game loop batches through decide_actions instead
+		with torch.inference_mode():
+			probs, _ = policy_outputs([self], observation.unsqueeze(0))
+			return sample_actions(probs, [self.game.round_rng.random()]).item()
 
 	def get_agent_keys(self):
 		# Map the action to Pygame key presses
-		action = self.decide_action(self.game.get_game_state())
+		action = self.decide_action(self.get_observation())
 
 		keys = {
 			pygame.K_UP: False,
@@ -205,11 +196,9 @@ class Agent:
 		# keys[pygame.K_SPACE] = True
 		return keys
 
-	def store_transition(self, state, action, reward, next_state, done):
-		# Preprocess states before storing
-		processed_state = self.preprocess_state(state).numpy()
-		processed_next_state = self.preprocess_state(next_state).numpy()
-		self.memory.append((processed_state, action, reward, processed_next_state, done))
+	def store_transition(self, action, reward, done, log_prob=0.0, value=0.0):
+		# The state was written into the buffer's next row at decision time, its next state is the following row
+		self.memory.add(action, reward, done, log_prob, value)
 
 	def compute_rewards(self):
 		round_num = self.game.iteration
@@ -247,89 +236,124 @@ class Agent:
 		rewards.append(points)
 		self.game.agent_points[self.agent_id] = points
 
-		for i in range(min(len(self.memory), len(rewards))):
-			self.memory[i] = (*self.memory[i][:2], rewards[i], *self.memory[i][3:])
+		count = min(len(self.memory), len(rewards))
+		self.memory.rewards[:count] = rewards[:count]
 
-	def compute_step_reward(self, prev_state, next_state):
-		old_dist = self.get_distance(prev_state)
-		new_dist = self.get_distance(next_state)
+	def compute_step_reward(self, old_dist, new_dist):
 		return (old_dist - new_dist) * 0.1
 
-	def train(self, batch_size=32, clip_epsilon=0.2, epochs=20):
+	def train(self, batch_size=32, minibatch_size=256, clip_epsilon=0.2, epochs=None, target_kl=None):
+		# PPO on the collected rollouts: shuffled minibatches, one forward per minibatch,
+		# ratios against the log-probs recorded when the actions were sampled
+		epochs = self.ppo_epochs if epochs is None else epochs
+		target_kl = self.target_kl if target_kl is None else target_kl
+
 		# Compute Rewards
 		self.compute_rewards()
 
 		if len(self.memory) < batch_size:
+			self.memory.clear()
 			return
 
-		states, actions, rewards, dones = zip(*[(s, a, r, d) for s, a, r, _, d in self.memory])
-		states = torch.FloatTensor(np.array(states))
-		actions = torch.LongTensor(np.array(actions))
-		rewards = torch.FloatTensor(np.array(rewards))
-		dones = torch.FloatTensor(np.array(dones))
-
-		G = []
-		R = 0
-		for reward, done in zip(reversed(rewards), reversed(dones)):
-			if done:
-				R = 0
-			R = reward + self.gamma * R
-			G.insert(0, R)
-		G = torch.FloatTensor(G)
-		G = (G - G.mean()) / (G.std() + 1e-8)
-
-		for _ in range(epochs):
-			probs = self.policy_net(states)
-			dist = torch.distributions.Categorical(probs)
-			log_probs = dist.log_prob(actions)
-
-			new_probs = self.policy_net(states)
-			new_dist = torch.distributions.Categorical(new_probs)
-			new_log_probs = new_dist.log_prob(actions)
-
-			ratios = torch.exp(new_log_probs - log_probs.detach())
-			clipped_ratios = torch.clamp(ratios, 1 - clip_epsilon, 1 + clip_epsilon)
-			loss = -torch.min(ratios * G, clipped_ratios * G).mean()
-
-			self.optimizer.zero_grad()
-			loss.backward()
-			self.optimizer.step()
-
-		self.memory = []
+		batch = self.memory.tensors()
+		states, actions, old_log_probs = batch["observations"], batch["actions"], batch["log_probs"]
+
+		advantages, returns = self.memory.compute_advantages(self.gamma, self.gae_lambda)
+		advantages = torch.from_numpy(advantages)
+		returns = torch.from_numpy(returns)
+		advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+
+		optimizer = self.get_optimizer()
+		size = len(self.memory)
+		for epoch in range(epochs):
+			approx_kl = 0.0
+			for indices in torch.randperm(size, generator=self.game.torch_rng).split(minibatch_size):
+				probs, values = self.policy_net.forward_with_value(states[indices])
+				log_probs = probs.gather(1, actions[indices].unsqueeze(1)).squeeze(1).clamp_min(1e-8).log()
+				log_ratio = log_probs - old_log_probs[indices]
+				ratios = torch.exp(log_ratio)
+				clipped_ratios = torch.clamp(ratios, 1 - clip_epsilon, 1 + clip_epsilon)
+				minibatch_advantages = advantages[indices]
+				loss = -torch.min(ratios * minibatch_advantages, clipped_ratios * minibatch_advantages).mean()
+				loss = loss + self.value_coef * F.mse_loss(values, returns[indices])
+
+				optimizer.zero_grad()
+				loss.backward()
+				optimizer.step()
+
+				with torch.no_grad():
+					# k3 estimator of KL(old || new), weighted by minibatch size
+					approx_kl += ((ratios - 1) - log_ratio).sum().item()
+
+			if target_kl is not None and approx_kl / size > target_kl:
+				break  # The policy moved far enough from the one that collected the data
+
+		self.memory.clear()
 
 	def update(self):
-		done = self.game.check_done()
-
-		if self.tank.awaiting_decision:
-			# Decide what to do
-			state = self.game.get_game_state()
-			action = self.decide_action(state)
-			keys = self.map_action_to_keys(action)
-
-			self.current_action = action
-			self.current_keys = keys
-			self.previous_state = state
-
-			self.tank.active_keys = keys
-			self.tank.awaiting_decision = False
-			self.tank.most_recent_decision_point = self.tank.temp_decision_point
-
+		if self.prepare_update():
+			decide_actions([self])
+		self.finish_update()
+
+	def prepare_update(self):
+		# First half of a frame: returns True when this agent needs a decision (pending_observation is set)
+		self.done = self.game.check_done()
+		self.decided_this_frame = self.tank.awaiting_decision
+		if not self.tank.awaiting_decision:
+			return False
+
+		if self.game.replaying:
+			return True  # The action comes from the recording, nothing to observe
+
+		started = self.game.timer.start()
+		if self.game.headless:
+			# Encode straight into the rollout buffer, the row becomes the transition's state once stored
+			observation = self.memory.next_observation_row()
+			observation[:] = self.game.encoder.encode()
+			self.previous_distance = self.get_distance()
 		else:
-			if self.game.headless:
+			observation = self.game.encoder.encode().copy()
+		self.pending_observation = torch.from_numpy(observation)
+		self.game.timer.lap("encode", started)
+		return True
+
+	def apply_decision(self, action, log_prob=None, value=None):
+		keys = self.map_action_to_keys(action)
+		self.current_action = action
+		self.current_log_prob = log_prob
+		self.current_value = value
+		self.current_keys = keys
+		self.pending_observation = None
+		if self.game.recorder:
+			self.game.recorder.record_decision(0 if self is self.game.agent1 else 1, action)
+
+		self.tank.active_keys = keys
+		self.tank.awaiting_decision = False
+		self.tank.most_recent_decision_point = self.tank.temp_decision_point
+
+	def finish_update(self):
+		# Second half of a frame, after decisions: record the transition or keep moving
+		if self.decided_this_frame is None:
+			return  # Another agent ended the round in this frame
+		timer = self.game.timer
+		started = timer.start()
+		if not self.decided_this_frame:
+			if self.game.headless and not self.game.replaying:
 				# Compute reward based on distance improvement
-				next_state = self.game.get_game_state()
-				reward = self.compute_step_reward(self.previous_state, next_state)
+				reward = self.compute_step_reward(self.previous_distance, self.get_distance())
 
-				done = self.game.check_done()
-				self.store_transition(self.previous_state, self.current_action, reward, next_state, done)
+				self.done = self.game.check_done()
+				self.store_transition(self.current_action, reward, self.done, self.current_log_prob, self.current_value)
+				started = timer.lap("store_transition", started)
 
 			self.tank.awaiting_decision = True  # Request next decision
 
-		# Continue current movement
+		# Continue current movement (collisions; the decision point lookup is timed in Game.begin_update)
 		if not self.tank.awaiting_decision and self.tank.active_keys:
 			self.tank.perform_action(self.tank.active_keys, self.opponent)
+			timer.lap("move", started)
 
-		if done:
+		if self.done:
 			self.game.round_over()
 
 	def calculate_time_bonus(self, time_elapsed):
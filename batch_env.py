@@ -0,0 +1,404 @@
+import os
+import numpy as np
+
+from map import TANK1_STARTING_POSITIONS, TANK2_STARTING_POSITIONS, load_stage_template
+
+# Geometry and timing, same values as Game / Tank / Bullet
+SCREEN_SIZE = 832
+TILE_SIZE = 32
+GRID_SIZE = 26
+TANK_SIZE = 52
+TANK_SPEED = 4
+EAGLE_SIZE = 64
+BULLET_SIZE = 10
+BULLET_SPEED = 10
+SHOT_COOLDOWN_MS = 500
+FPS = 60
+MAX_TIME = 12
+
+# Actions (same indices as Agent.map_action_to_keys, plus SHOOT) and directions
+UP, DOWN, LEFT, RIGHT, SHOOT = range(5)
+NOOP = -1
+DIRECTIONS = ("UP", "DOWN", "LEFT", "RIGHT")
+MOVE_DX = np.array([0, 0, -TANK_SPEED, TANK_SPEED])
+MOVE_DY = np.array([-TANK_SPEED, TANK_SPEED, 0, 0])
+
+
+def _ceil_div(a, b):
+	return -np.floor_divide(-a, b)
+
+
+def _boxes_hit_tiles(grid, x, y, size, span, env_ids=None):
+	# True where a size x size box at (x, y) strictly overlaps a set cell of grid.
+	# grid is (26, 26) shared by every match, or (N, 26, 26) indexed through env_ids.
+	c0 = np.floor_divide(x, TILE_SIZE)
+	c1 = _ceil_div(x + size, TILE_SIZE) - 1
+	r0 = np.floor_divide(y, TILE_SIZE)
+	r1 = _ceil_div(y + size, TILE_SIZE) - 1
+	offsets = np.arange(span)
+	cols = c0[..., None] + offsets
+	rows = r0[..., None] + offsets
+	col_ok = (cols <= c1[..., None]) & (cols >= 0) & (cols < GRID_SIZE)
+	row_ok = (rows <= r1[..., None]) & (rows >= 0) & (rows < GRID_SIZE)
+	rows = np.clip(rows, 0, GRID_SIZE - 1)[..., :, None]
+	cols = np.clip(cols, 0, GRID_SIZE - 1)[..., None, :]
+	if env_ids is None:
+		cells = grid[rows, cols]
+	else:
+		cells = grid[env_ids.reshape(env_ids.shape + (1, 1)), rows, cols]
+	return (cells & row_ok[..., :, None] & col_ok[..., None, :]).any(axis=(-2, -1))
+
+
+class BatchEnv:
+	"""N Battle City matches held as NumPy arrays and stepped together.
+
+	Movement, collision and bullet rules follow Tank.perform_action, Tank.check_collisions
+	and Tank.update_bullets. Tank 0 is the object game's tank1, tank 1 is tank2.
+	"""
+
+	def __init__(self, num_envs, stage_file=None, max_bullets=4, max_time=MAX_TIME, seed=None):
+		self.num_envs = num_envs
+		self.stage_file = stage_file or os.path.join(os.path.dirname(__file__), "stages/no-obstacles.txt")
+		self.max_bullets = max_bullets  # Per tank; 500ms cooldown keeps at most 3 in flight
+		self.max_time = max_time
+		self.rng = np.random.default_rng(seed)
+
+		# Static stage layout, shared with the object-based Map through the template cache
+		stage = load_stage_template(self.stage_file, TILE_SIZE)
+		if not (stage.has_tank1_spawn and stage.has_tank2_spawn):
+			raise ValueError(f"Stage {self.stage_file} needs both tank spawns ('1' and '2')")
+		self.brick_rc = stage.brick_xy[:, ::-1] // TILE_SIZE  # (row, col)
+		self.steel_rc = stage.steel_xy[:, ::-1] // TILE_SIZE
+		self.eagle_xy = np.array([(x, y) for x, y, _ in stage.eagles], dtype=np.int64).reshape(-1, 2)
+		self.eagle_types = [tile for _, _, tile in stage.eagles]
+		self.steel_grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=bool)
+		self.steel_grid[self.steel_rc[:, 0], self.steel_rc[:, 1]] = True
+		self.brick_index = stage.brick_index
+		self.tank1_spawns = np.array(TANK1_STARTING_POSITIONS) - TANK_SIZE // 2
+		self.tank2_spawns = np.array(TANK2_STARTING_POSITIONS) - TANK_SIZE // 2
+
+		# Per-match state
+		n, b = num_envs, max_bullets
+		self.tank_x = np.zeros((n, 2), dtype=np.int64)
+		self.tank_y = np.zeros((n, 2), dtype=np.int64)
+		self.tank_dir = np.zeros((n, 2), dtype=np.int64)
+		self.destroyed = np.zeros((n, 2), dtype=bool)
+		self.last_shot_time = np.zeros((n, 2), dtype=np.int64)
+		self.tank_eagle = np.zeros((n, 2), dtype=np.int64)
+		self.bullet_x = np.zeros((n, 2, b), dtype=np.int64)
+		self.bullet_y = np.zeros((n, 2, b), dtype=np.int64)
+		self.bullet_dx = np.zeros((n, 2, b), dtype=np.int64)
+		self.bullet_dy = np.zeros((n, 2, b), dtype=np.int64)
+		self.bullet_alive = np.zeros((n, 2, b), dtype=bool)
+		self.brick_destroyed = np.zeros((n, len(self.brick_rc)), dtype=bool)
+		self.brick_grid = np.zeros((n, GRID_SIZE, GRID_SIZE), dtype=bool)  # Intact bricks, kept in sync with brick_destroyed
+		self.eagle_destroyed = np.zeros((n, len(self.eagle_xy)), dtype=bool)
+		self.sim_tick = np.zeros(n, dtype=np.int64)
+		self.start_tick = np.zeros(n, dtype=np.int64)
+
+		self.reset()
+
+	def reset(self, env_ids=None):
+		# Start a new round in the given matches (all by default)
+		env_ids = np.arange(self.num_envs) if env_ids is None else np.asarray(env_ids, dtype=np.int64)
+		count = len(env_ids)
+		if count == 0:
+			return
+
+		spawn1 = self.tank1_spawns[self.rng.integers(len(self.tank1_spawns), size=count)]
+		spawn2 = self.tank2_spawns[self.rng.integers(len(self.tank2_spawns), size=count)]
+		self.tank_x[env_ids] = np.stack([spawn1[:, 0], spawn2[:, 0]], axis=1)
+		self.tank_y[env_ids] = np.stack([spawn1[:, 1], spawn2[:, 1]], axis=1)
+		self.tank_dir[env_ids] = UP
+		self.destroyed[env_ids] = False
+		self.last_shot_time[env_ids] = 0
+		self.bullet_alive[env_ids] = False
+		self.brick_destroyed[env_ids] = False
+		self.brick_grid[env_ids] = False
+		self.brick_grid[env_ids[:, None], self.brick_rc[:, 0], self.brick_rc[:, 1]] = True
+		self.eagle_destroyed[env_ids] = False
+		self.start_tick[env_ids] = self.sim_tick[env_ids]
+		self.assign_eagles(env_ids)
+
+	def assign_eagles(self, env_ids):
+		# Each tank guards the eagle nearest to its spawn (as in Game.init_game)
+		if len(self.eagle_xy) == 0:
+			return
+		dx = self.tank_x[env_ids][:, :, None] - self.eagle_xy[:, 0]
+		dy = self.tank_y[env_ids][:, :, None] - self.eagle_xy[:, 1]
+		self.tank_eagle[env_ids] = np.argmin(dx * dx + dy * dy, axis=2)
+
+	def get_time_elapsed(self):
+		return np.round((self.sim_tick - self.start_tick) / FPS)
+
+	def get_ticks(self):
+		return self.sim_tick * 1000 // FPS
+
+	def step(self, actions):
+		"""Advance every match by one frame.
+
+		actions is an (N, 2) int array of UP/DOWN/LEFT/RIGHT/SHOOT, or NOOP to stand still.
+		Returns (rewards, dones) where rewards is the per-tank distance shaping of
+		Agent.compute_step_reward. Finished matches are not reset automatically.
+		"""
+		actions = np.asarray(actions, dtype=np.int64)
+		time_elapsed = self.get_time_elapsed()
+		old_dist = self.get_distance()
+
+		# Same order as Game.update: both tanks' bullets, then both tanks' moves
+		self.update_bullets(0)
+		self.update_bullets(1)
+		self.perform_action(0, actions[:, 0])
+		self.perform_action(1, actions[:, 1])
+
+		rewards = np.repeat(((old_dist - self.get_distance()) * 0.1)[:, None], 2, axis=1)
+		dones = self.check_done(time_elapsed)
+		self.sim_tick += 1
+		return rewards, dones
+
+	def check_done(self, time_elapsed=None):
+		time_elapsed = self.get_time_elapsed() if time_elapsed is None else time_elapsed
+		done = self.destroyed.any(axis=1) | (time_elapsed >= self.max_time)
+		if len(self.eagle_xy):
+			done |= np.take_along_axis(self.eagle_destroyed, self.tank_eagle, axis=1).any(axis=1)
+		return done
+
+	def get_distance(self):
+		dx = (self.tank_x[:, 0] - self.tank_x[:, 1]) / SCREEN_SIZE
+		dy = (self.tank_y[:, 0] - self.tank_y[:, 1]) / SCREEN_SIZE
+		return np.sqrt(dx * dx + dy * dy)
+
+	def perform_action(self, tank, action):
+		other = 1 - tank
+		alive = ~self.destroyed[:, tank]
+		moving = alive & (action >= UP) & (action <= RIGHT)
+		move = np.where(moving, action, 0)
+		self.tank_dir[:, tank] = np.where(moving, action, self.tank_dir[:, tank])
+		new_x = self.tank_x[:, tank] + np.where(moving, MOVE_DX[move], 0)
+		new_y = self.tank_y[:, tank] + np.where(moving, MOVE_DY[move], 0)
+
+		shooting = alive & (action == SHOOT)
+		if shooting.any():
+			self.shoot(tank, np.flatnonzero(shooting))
+
+		env_ids = np.flatnonzero(moving)
+		if len(env_ids) == 0:
+			return
+		x, y = new_x[env_ids], new_y[env_ids]
+
+		# Bricks and steel walls through the tile grids
+		blocked = _boxes_hit_tiles(self.steel_grid, x, y, TANK_SIZE, 3)
+		blocked |= _boxes_hit_tiles(self.brick_grid, x, y, TANK_SIZE, 3, env_ids)
+
+		# Intact eagles
+		if len(self.eagle_xy):
+			ex, ey = self.eagle_xy[:, 0], self.eagle_xy[:, 1]
+			hit_eagle = (
+				(x[:, None] < ex + EAGLE_SIZE) & (x[:, None] + TANK_SIZE > ex)
+				& (y[:, None] < ey + EAGLE_SIZE) & (y[:, None] + TANK_SIZE > ey)
+			)
+			blocked |= (hit_eagle & ~self.eagle_destroyed[env_ids]).any(axis=1)
+
+		# The other tank
+		ox, oy = self.tank_x[env_ids, other], self.tank_y[env_ids, other]
+		blocked |= (ox < x + TANK_SIZE) & (ox + TANK_SIZE > x) & (oy < y + TANK_SIZE) & (oy + TANK_SIZE > y)
+
+		# Screen bounds
+		limit = SCREEN_SIZE - TANK_SIZE
+		ok = ~blocked & (x >= 0) & (x <= limit) & (y >= 0) & (y <= limit)
+		self.tank_x[env_ids[ok], tank] = x[ok]
+		self.tank_y[env_ids[ok], tank] = y[ok]
+
+	def shoot(self, tank, env_ids):
+		now = self.get_ticks()[env_ids]
+		ready = now - self.last_shot_time[env_ids, tank] >= SHOT_COOLDOWN_MS
+		env_ids, now = env_ids[ready], now[ready]
+
+		# First free slot of the pool, matches with a full pool skip the shot
+		free = ~self.bullet_alive[env_ids, tank]
+		has_free = free.any(axis=1)
+		env_ids, now = env_ids[has_free], now[has_free]
+		if len(env_ids) == 0:
+			return
+		slot = np.argmax(free[has_free], axis=1)
+		self.last_shot_time[env_ids, tank] = now
+
+		x, y = self.tank_x[env_ids, tank], self.tank_y[env_ids, tank]
+		direction = self.tank_dir[env_ids, tank]
+		half = TANK_SIZE // 2 - BULLET_SIZE // 2
+		bullet_x = np.select(
+			[direction == UP, direction == DOWN, direction == LEFT],
+			[x + half, x + half, x - BULLET_SIZE],
+			x + TANK_SIZE,
+		)
+		bullet_y = np.select(
+			[direction == UP, direction == DOWN, direction == LEFT],
+			[y - BULLET_SIZE, y + TANK_SIZE, y + half],
+			y + half,
+		)
+		self.bullet_x[env_ids, tank, slot] = bullet_x
+		self.bullet_y[env_ids, tank, slot] = bullet_y
+		self.bullet_dx[env_ids, tank, slot] = np.where(direction == LEFT, -BULLET_SPEED, np.where(direction == RIGHT, BULLET_SPEED, 0))
+		self.bullet_dy[env_ids, tank, slot] = np.where(direction == UP, -BULLET_SPEED, np.where(direction == DOWN, BULLET_SPEED, 0))
+		self.bullet_alive[env_ids, tank, slot] = True
+
+	def update_bullets(self, tank):
+		# Bullets of a destroyed tank are frozen, like in Tank.update_bullets
+		other = 1 - tank
+		env_ids = np.flatnonzero(~self.destroyed[:, tank] & self.bullet_alive[:, tank].any(axis=1))
+		if len(env_ids) == 0:
+			return
+
+		alive = self.bullet_alive[env_ids, tank]
+		x = self.bullet_x[env_ids, tank] + self.bullet_dx[env_ids, tank] * alive
+		y = self.bullet_y[env_ids, tank] + self.bullet_dy[env_ids, tank] * alive
+		dx, dy = self.bullet_dx[env_ids, tank], self.bullet_dy[env_ids, tank]
+		self.bullet_x[env_ids, tank] = x
+		self.bullet_y[env_ids, tank] = y
+
+		# Off screen
+		alive &= ~((x < 0) | (x > SCREEN_SIZE) | (y < 0) | (y > SCREEN_SIZE))
+		active = alive.copy()
+		envs = np.broadcast_to(env_ids[:, None], x.shape)
+
+		# Enemy tank: any bullet corner inside its box (inclusive)
+		tx, ty = self.tank_x[env_ids, other][:, None], self.tank_y[env_ids, other][:, None]
+		in_x = ((tx <= x) & (x <= tx + TANK_SIZE)) | ((tx <= x + BULLET_SIZE) & (x + BULLET_SIZE <= tx + TANK_SIZE))
+		in_y = ((ty <= y) & (y <= ty + TANK_SIZE)) | ((ty <= y + BULLET_SIZE) & (y + BULLET_SIZE <= ty + TANK_SIZE))
+		hit = active & in_x & in_y
+		self.destroyed[env_ids[hit.any(axis=1)], other] = True
+		active &= ~hit
+
+		# Eagles: every intact eagle the bullet overlaps is destroyed
+		if len(self.eagle_xy):
+			ex, ey = self.eagle_xy[:, 0], self.eagle_xy[:, 1]
+			overlap = (
+				(x[..., None] < ex + EAGLE_SIZE) & (x[..., None] + BULLET_SIZE > ex)
+				& (y[..., None] < ey + EAGLE_SIZE) & (y[..., None] + BULLET_SIZE > ey)
+			)
+			overlap &= active[..., None] & ~self.eagle_destroyed[env_ids][:, None, :]
+			self.eagle_destroyed[env_ids] |= overlap.any(axis=1)
+			active &= ~overlap.any(axis=2)
+
+		# Bricks: a brick falls when one of its corners lies inside the damage bounds
+		if len(self.brick_rc):
+			vertical = dy != 0
+			rect_x = np.where(vertical, x - 12, x)
+			rect_y = np.where(vertical, y, y - 12)
+			rect_w = np.where(vertical, 32, 16)
+			rect_h = np.where(vertical, 16, 32)
+			kx = _ceil_div(rect_x, TILE_SIZE)
+			ky = _ceil_div(rect_y, TILE_SIZE)
+			lattice_ok = active & (kx * TILE_SIZE < rect_x + rect_w) & (ky * TILE_SIZE < rect_y + rect_h)
+			brick_hit = np.zeros_like(active)
+			for col in (kx - 1, kx):
+				for row in (ky - 1, ky):
+					ok = lattice_ok & (col >= 0) & (col < GRID_SIZE) & (row >= 0) & (row < GRID_SIZE)
+					row_c, col_c = np.clip(row, 0, GRID_SIZE - 1), np.clip(col, 0, GRID_SIZE - 1)
+					ok &= self.brick_grid[envs, row_c, col_c]
+					if ok.any():
+						self.brick_destroyed[envs[ok], self.brick_index[row_c[ok], col_c[ok]]] = True
+						self.brick_grid[envs[ok], row_c[ok], col_c[ok]] = False
+						brick_hit |= ok
+			active &= ~brick_hit
+
+		# Steel walls
+		if len(self.steel_rc):
+			active &= ~_boxes_hit_tiles(self.steel_grid, x, y, BULLET_SIZE, 2)
+
+		# Enemy bullets: every overlapping enemy bullet is removed along with this one
+		enemy_alive = self.bullet_alive[env_ids, other]
+		ox, oy = self.bullet_x[env_ids, other], self.bullet_y[env_ids, other]
+		clash = (
+			(np.abs(x[:, :, None] - ox[:, None, :]) < BULLET_SIZE)
+			& (np.abs(y[:, :, None] - oy[:, None, :]) < BULLET_SIZE)
+			& active[:, :, None] & enemy_alive[:, None, :]
+		)
+		self.bullet_alive[env_ids, other] = enemy_alive & ~clash.any(axis=1)
+		active &= ~clash.any(axis=2)
+
+		# Bullets that hit anything are gone
+		self.bullet_alive[env_ids, tank] = active
+
+
+def verify_parity(stage_file=None, frames=2000, seed=0):
+	"""Step the object-based Game and a one-match BatchEnv with the same random actions and
+	compare tanks, bullets, bricks and eagles every frame. Returns the number of frames checked.
+	"""
+	import random
+	os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+	import pygame
+	from game import Game
+	from map import Map
+	from tank import Tank
+
+	stage_file = stage_file or os.path.join(os.path.dirname(__file__), "stages/stage0.txt")
+	rng = random.Random(seed)
+	key_order = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_SPACE]
+
+	game = Game(headless=True)
+	env = BatchEnv(1, stage_file, seed=seed)
+	checked = 0
+
+	def new_round():
+		game.begin_round()
+		game.map = Map(game, stage_file)
+		game.tanks = []
+		game.tank1 = Tank(game, *game.map.tank1_pos, None)
+		game.tank2 = Tank(game, *game.map.tank2_pos, None)
+		game.tank1.opponent = game.tank2
+		game.tank2.opponent = game.tank1
+		for tank in game.tanks:
+			tank.eagle = min(game.map.eagles, key=lambda eagle: ((tank.x - eagle["x"]) ** 2 + (tank.y - eagle["y"]) ** 2) ** 0.5)
+		game.start_tick = game.sim_tick
+		env.reset()
+		env.tank_x[0] = [int(game.tank1.x), int(game.tank2.x)]
+		env.tank_y[0] = [int(game.tank1.y), int(game.tank2.y)]
+		env.assign_eagles(np.array([0]))
+
+	new_round()
+	for _ in range(frames):
+		game.timeElapsed = game.get_time_elapsed()
+		actions = [rng.randrange(5) for _ in game.tanks]
+
+		for tank in game.tanks:
+			tank.update()
+		for tank, action in zip(game.tanks, actions):
+			tank.perform_action({key: key == key_order[action] for key in key_order}, tank.opponent)
+		game_done = game.check_done()
+		_, dones = env.step(np.array([actions]))
+		game.advance_clock()
+
+		for index, tank in enumerate(game.tanks):
+			expected = (tank.x, tank.y, tank.direction, tank.destroyed, sorted((b.x, b.y) for b in tank.bullets))
+			alive = env.bullet_alive[0, index]
+			actual = (
+				env.tank_x[0, index], env.tank_y[0, index], DIRECTIONS[env.tank_dir[0, index]], env.destroyed[0, index],
+				sorted(zip(env.bullet_x[0, index][alive].tolist(), env.bullet_y[0, index][alive].tolist())),
+			)
+			assert expected == actual, f"tank {index + 1} diverged after {checked} frames: {expected} != {actual}"
+		assert np.array_equal(game.map.bricks.destroyed, env.brick_destroyed[0]), f"bricks diverged after {checked} frames"
+		assert np.array_equal(game.map.eagles.destroyed, env.eagle_destroyed[0]), f"eagles diverged after {checked} frames"
+		assert game_done == bool(dones[0]), f"done diverged after {checked} frames"
+		checked += 1
+
+		if game_done:
+			new_round()
+	return checked
+
+
+if __name__ == "__main__":
+	import time
+
+	for stage in ("no-obstacles.txt", "stage0.txt"):
+		stage_path = os.path.join(os.path.dirname(__file__), "stages", stage)
+		print(f"✅ Parity on {stage}: {verify_parity(stage_path)} frames match")
+
+	env = BatchEnv(256, os.path.join(os.path.dirname(__file__), "stages/stage0.txt"), seed=0)
+	start = time.perf_counter()
+	steps = 200
+	for _ in range(steps):
+		_, dones = env.step(env.rng.integers(5, size=(env.num_envs, 2)))
+		env.reset(np.flatnonzero(dones))
+	elapsed = time.perf_counter() - start
+	print(f"⚡ {env.num_envs * steps / elapsed:,.0f} env steps/sec with {env.num_envs} matches")
@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import torch
+
+from game import Game
+from merge_policies import merge_policies
+from policy_network import PolicyNetwork
+
+STAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stages")
+RUNS = 5  # Measured runs per metric, after one warm-up run
+MIN_RUN_SECONDS = 0.05  # timed() repeats short calls for at least this long per run
+QUICK_THRESHOLD = 0.25  # Default regression threshold of --quick runs, their numbers are noisier
+
+
+def sampled(run):
+	# One warm-up call of run(), then RUNS measured ones; returns their results
+	run()
+	return [run() for _ in range(RUNS)]
+
+
+def timed(function, repeat):
+	# Seconds per call for each run of at least `repeat` calls and MIN_RUN_SECONDS
+	def run():
+		calls = 0
+		start = time.perf_counter()
+		while calls < repeat or time.perf_counter() - start < MIN_RUN_SECONDS:
+			for _ in range(repeat):
+				function()
+			calls += repeat
+		return (time.perf_counter() - start) / calls
+	return sampled(run)
+
+
+def make_game(stage="no-obstacles.txt", observation_mode="flat"):
+	# Fresh headless game; the policy name keeps it from picking up merged policies from policies/
+	game = Game(headless=True, observation_mode=observation_mode, agent1_file="-", agent2_file="-")
+	game.stage_file = os.path.join(STAGES_PATH, stage)
+	game.policy_name = "benchmark"
+	game.persist_models = False
+	game.init_game()
+	return game
+
+
+def bench_env_steps(stage, frames):
+	# Game.step with random actions, including the resets between rounds; steps/s per run
+	game = make_game(stage)
+	actions = [None, 0, 1, 2, 3, 4]
+	rng = random.Random(0)
+
+	def run():
+		start = time.perf_counter()
+		for _ in range(frames):
+			_, _, done, _ = game.step(rng.choice(actions), rng.choice(actions))
+			if done:
+				game.reset()
+		return frames / (time.perf_counter() - start)
+	return sampled(run)
+
+
+def bench_encode(observation_mode, repeat):
+	game = make_game("stage0.txt", observation_mode)
+	return timed(game.encoder.encode, repeat)
+
+
+def bench_policy_forward(batch_size, repeat):
+	game = make_game("stage0.txt")
+	network = PolicyNetwork(game.encoder.size, 4)
+	observations = torch.from_numpy(np.tile(game.encoder.encode(), (batch_size, 1)))
+
+	def forward():
+		with torch.inference_mode():
+			network(observations)
+	return timed(forward, repeat)
+
+
+def bench_ppo_update(transitions=1000):
+	# One Agent.train on a full buffer of `transitions` rows, fixed epochs (no KL early stop)
+	game = make_game("stage0.txt")
+	agent = game.agent1
+	observation = game.encoder.encode()
+	rng = np.random.default_rng(0)
+
+	def train():
+		agent.memory.clear()
+		for _ in range(transitions):
+			agent.memory.next_observation_row()[:] = observation
+			agent.memory.add(rng.integers(4), rng.normal(), rng.random() < 0.01, np.log(0.25), 0.0)
+		start = time.perf_counter()
+		agent.train(target_kl=None)
+		return (time.perf_counter() - start) * 1000 / transitions
+	return sampled(train)  # The warm-up builds the optimizer
+
+
+def bench_merge(num_files):
+	game = make_game("stage0.txt")
+	state_dict = game.agent1.policy_net.state_dict()
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		try:
+			os.mkdir("policies")
+
+			def run():
+				# merge_policies deletes its inputs, every run writes them again (untimed)
+				for i in range(num_files):
+					torch.save(state_dict, f"policies/agent1_policy_{i}.pth")
+				start = time.perf_counter()
+				with contextlib.redirect_stdout(io.StringIO()):
+					merge_policies("agent1_policy_", "agent1_policy_merged.pth")
+				return time.perf_counter() - start
+			return sampled(run)
+		finally:
+			os.chdir(cwd)
+
+
+def bench_worker_startup():
+	# Cold start of a fresh interpreter up to an initialized headless game
+	code = "from game import Game; g = Game(headless=True, agent1_file='-', agent2_file='-'); g.policy_name = 'benchmark'; g.init_game()"
+
+	def run():
+		start = time.perf_counter()
+		subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True, capture_output=True)
+		return time.perf_counter() - start
+	return sampled(run)  # The warm-up fills the OS file cache
+
+
+def run_benchmarks(quick=False):
+	scale = 0.2 if quick else 1.0
+	results = {}
+
+	def record(name, samples, unit, higher_is_better, scale=1.0):
+		# The best run is the value, the spread of the runs around it is the noise compare() allows for
+		samples = [sample * scale for sample in samples]
+		value = max(samples) if higher_is_better else min(samples)
+		spread = (max(samples) - min(samples)) / value if value else 0.0
+		results[name] = {"value": value, "spread": spread, "unit": unit, "higher_is_better": higher_is_better}
+		print(f"  {name}: {value:.4g} {unit} (spread {spread:.1%})")
+
+	print("🏁 Running benchmarks...")
+	for stage in ("no-obstacles.txt", "stage0.txt"):
+		record(f"env_steps/{stage}", bench_env_steps(stage, int(5000 * scale)), "steps/s", True)
+	for mode in ("flat", "planes"):
+		record(f"encode/{mode}", bench_encode(mode, int(2000 * scale)), "us/call", False, 1e6)
+	for batch_size in (1, 8, 32, 128):
+		record(f"policy_forward/batch{batch_size}", bench_policy_forward(batch_size, int(500 * scale)), "us/call", False, 1e6)
+	record("ppo_update/1k_transitions", bench_ppo_update(), "s", False)
+	record("merge_policies/50_files", bench_merge(50), "s", False)
+	record("worker_startup", bench_worker_startup(), "s", False)
+	return results
+
+
+def compare(results, baseline, threshold):
+	# Returns the names of the metrics that got worse than the baseline by more than threshold
+	# and by more than the spread measured in either run
+	regressions = []
+	for name, result in results.items():
+		if name not in baseline:
+			continue
+		old, new = baseline[name]["value"], result["value"]
+		change = (new - old) / old if old else 0.0
+		worse = -change if result["higher_is_better"] else change
+		allowed = max(threshold, result.get("spread", 0.0), baseline[name].get("spread", 0.0))
+		flag = "❌" if worse > allowed else "✅"
+		if worse > allowed:
+			regressions.append(name)
+		print(f"{flag} {name}: {old:.4g} -> {new:.4g} {result['unit']} ({change:+.1%}, allowed {allowed:.0%})")
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Headless benchmarks for the simulation, encoder, inference, learner and merge")
+	parser.add_argument("--output", default="benchmark.json", help="Where to write the results (JSON)")
+	parser.add_argument("--compare", help="Baseline JSON to compare against, exits with 1 on regressions")
+	parser.add_argument("--threshold", type=float, help=f"Relative slowdown counted as a regression (default 0.10, {QUICK_THRESHOLD} with --quick)")
+	parser.add_argument("--quick", action="store_true", help="Fewer iterations, noisier numbers")
+	args = parser.parse_args()
+	if args.threshold is None:
+		args.threshold = QUICK_THRESHOLD if args.quick else 0.10
+
+	results = run_benchmarks(args.quick)
+	report = {
+		"meta": {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"torch": torch.__version__,
+			"numpy": np.__version__,
+			"cpus": os.cpu_count(),
+			"torch_threads": torch.get_num_threads(),
+			"quick": args.quick,
+			"runs": RUNS,
+		},
+		"results": results,
+	}
+	with open(args.output, "w") as f:
+		json.dump(report, f, indent=2)
+	print(f"💾 Saved results to {args.output}")
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)["results"]
+		regressions = compare(results, baseline, args.threshold)
+		if regressions:
+			print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+			sys.exit(1)
+		print("✅ No regressions")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,86 +1,217 @@
 # Bullet class
 import pygame
+import numpy as np
+
+from map import STEEL, EAGLE_SIZE
+
+BULLET_SIZE = 10
+# Bullets in flight per tank: the 500ms cooldown keeps about 3 at 60 FPS, slow real-time frames allow more
+POOL_CAPACITY = 32
+VECTORIZE_FROM = 16  # Live bullets of one tank from which BulletPool.update switches to numpy passes
 
 
 class Bullet:
+	"""Copy of one pooled bullet, for drawing and for code that wants bullet objects (see BulletPool.bullets)."""
+
+	__slots__ = ("game", "x", "y", "dx", "dy", "width", "height", "color")
+
 	def __init__(self, game, x, y, dx, dy):
 		self.game = game
 		self.x = x
 		self.y = y
 		self.dx = dx
 		self.dy = dy
-		self.width = 10
-		self.height = 10
+		self.width = BULLET_SIZE
+		self.height = BULLET_SIZE
 		self.color = (255, 255, 255)
 
-	def update(self):
-		self.x += self.dx
-		self.y += self.dy
-
 	def draw(self):
 		pygame.draw.rect(self.game.screen, self.color, (self.x, self.y, self.width, self.height))
 
-	def is_off_screen(self):
-		return self.x < 0 or self.x > self.game.SCREEN_WIDTH or self.y < 0 or self.y > self.game.SCREEN_HEIGHT
 
-	def collides_with(self, wall):
-		# Check collision with a wall
-		return (
-			self.x < wall["x"] + self.game.TILE_SIZE
-			and self.x + self.width > wall["x"]
-			and self.y < wall["y"] + self.game.TILE_SIZE
-			and self.y + self.height > wall["y"]
-		)
+class BulletPool:
+	"""Bullets of both tanks of a match as arrays indexed [owner, slot], owner being Tank.index.
 
-	def collides_with_eagle(self, eagle):
-		# Check collision with a wall
-		return (
-			self.x < eagle["x"] + 64
-			and self.x + self.width > eagle["x"]
-			and self.y < eagle["y"] + 64
-			and self.y + self.height > eagle["y"]
-		)
+	The live bullets of an owner are packed at the front of its row in firing order, count[owner]
+	of them. update() moves one owner's bullets, works out every hit against the world as it was
+	at the start of the pass, then applies them and drops the spent bullets in one go, so the
+	outcome does not depend on the order bullets are checked in. Hits are resolved bullet by
+	bullet for a handful of bullets and in vectorized passes from VECTORIZE_FROM bullets on,
+	where numpy's per-call overhead pays off.
+	"""
 
-	def create_damage_bounds(self):
-		# Create damage bounds based on the bullet's movement direction
-		if self.dy != 0:  # Vertical movement
-			return {
-				"x": self.x - 12,
-				"y": self.y,
-				"width": 32,
-				"height": 16,
-			}
-		elif self.dx != 0:  # Horizontal movement
-			return {
-				"x": self.x,
-				"y": self.y - 12,
-				"width": 16,
-				"height": 32,
-			}
-
-	def collides_with_tank(self, tank):
-		# Check if any corner of the bullet is inside the tank's bounding box
-		corners = [
-			(self.x, self.y),  # Top-left
-			(self.x + self.width, self.y),  # Top-right
-			(self.x, self.y + self.height),  # Bottom-left
-			(self.x + self.width, self.y + self.height),  # Bottom-right
+	def __init__(self, game, capacity=POOL_CAPACITY):
+		self.game = game
+		self.capacity = capacity
+		self.x = np.zeros((2, capacity))
+		self.y = np.zeros((2, capacity))
+		self.dx = np.zeros((2, capacity))
+		self.dy = np.zeros((2, capacity))
+		self.count = [0, 0]
+
+	def clear(self, owner):
+		self.count[owner] = 0
+
+	def fire(self, owner, x, y, dx, dy):
+		# A full pool skips the shot
+		slot = self.count[owner]
+		if slot == self.capacity:
+			return False
+		self.x[owner, slot] = x
+		self.y[owner, slot] = y
+		self.dx[owner, slot] = dx
+		self.dy[owner, slot] = dy
+		self.count[owner] = slot + 1
+		return True
+
+	def positions(self, owner):
+		# Views of the live bullets' x and y, valid until the next update
+		count = self.count[owner]
+		return self.x[owner, :count], self.y[owner, :count]
+
+	def bullets(self, owner):
+		count = self.count[owner]
+		return [
+			Bullet(self.game, x, y, dx, dy)
+			for x, y, dx, dy in zip(*(array[owner, :count].tolist() for array in (self.x, self.y, self.dx, self.dy)))
 		]
 
-		for corner_x, corner_y in corners:
-			if (
-				tank.x <= corner_x <= tank.x + tank.width
-				and tank.y <= corner_y <= tank.y + tank.height
-			):
-				return True
-
-		return False
-
-	def collides_with_bullet(self, other_bullet):
-		# Check if this bullet collides with another bullet
-		return (
-			self.x < other_bullet.x + other_bullet.width
-			and self.x + self.width > other_bullet.x
-			and self.y < other_bullet.y + other_bullet.height
-			and self.y + self.height > other_bullet.y
+	def update(self, owner, enemy_tank):
+		count = self.count[owner]
+		if count == 0:
+			return
+		if count < VECTORIZE_FROM:
+			keep, tank_hit, eagles, bricks, enemy_bullets = self.collide_each(owner, enemy_tank)
+		else:
+			self.x[owner, :count] += self.dx[owner, :count]
+			self.y[owner, :count] += self.dy[owner, :count]
+			keep, tank_hit, eagles, bricks, enemy_bullets = self.collide_vectorized(owner, enemy_tank)
+
+		if tank_hit:
+			enemy_tank.destroy()
+		if len(eagles) or len(bricks):
+			game_map = self.game.map
+			for eagle_index in sorted(set(eagles)):
+				game_map.destroy_eagle(eagle_index)
+			for brick_index in dict.fromkeys(bricks):  # Two bullets may share a brick, it falls once
+				game_map.destroy_brick(brick_index)
+		if len(enemy_bullets):
+			enemy = 1 - owner
+			enemy_keep = np.ones(self.count[enemy], dtype=bool)
+			enemy_keep[enemy_bullets] = False
+			self.keep(enemy, enemy_keep)
+		if not all(keep):
+			self.keep(owner, np.asarray(keep, dtype=bool))
+
+	def collide_each(self, owner, enemy_tank):
+		# Moves the bullets and checks them one at a time, first hit wins in the order tank, eagles,
+		# bricks, steel, enemy bullets. Returns (keep per bullet, tank hit, eagle indices, brick indices,
+		# enemy bullet slots), indices may repeat. Plain element access, numpy calls cost more than
+		# they save here.
+		game = self.game
+		game_map = game.map
+		eagles = game_map.eagles
+		tx, ty, tw, th = enemy_tank.x, enemy_tank.y, enemy_tank.width, enemy_tank.height
+		enemy = 1 - owner
+		keep = []
+		tank_hit = False
+		eagles_hit, bricks, enemy_bullets = [], [], []
+		for slot in range(self.count[owner]):
+			x = self.x.item(owner, slot) + self.dx.item(owner, slot)
+			y = self.y.item(owner, slot) + self.dy.item(owner, slot)
+			self.x[owner, slot] = x
+			self.y[owner, slot] = y
+			keep.append(False)
+			# Off screen
+			if x < 0 or x > game.SCREEN_WIDTH or y < 0 or y > game.SCREEN_HEIGHT:
+				continue
+
+			# Enemy tank: any bullet corner inside its box (inclusive), the tank being the larger box
+			if tx - BULLET_SIZE <= x <= tx + tw and ty - BULLET_SIZE <= y <= ty + th:
+				tank_hit = True
+				continue
+
+			# Eagles
+			hit = [
+				index for index, (ex, ey) in enumerate(eagles.positions)
+				if ex - BULLET_SIZE < x < ex + EAGLE_SIZE and ey - BULLET_SIZE < y < ey + EAGLE_SIZE and not eagles.destroyed[index]
+			]
+			if hit:
+				eagles_hit.extend(hit)
+				continue
+
+			# Bricks: damage bounds are 32x16 across the flight direction
+			if game_map.bricks.positions:
+				if self.dy.item(owner, slot) != 0:
+					hit = game_map.bricks_in_damage_bounds(x - 12, y, 32, 16)
+				else:
+					hit = game_map.bricks_in_damage_bounds(x, y - 12, 16, 32)
+				if hit:
+					bricks.extend(hit)
+					continue
+
+			# Steel walls
+			if game_map.steel_walls.positions and game_map.box_hits(x, y, BULLET_SIZE, BULLET_SIZE, STEEL):
+				continue
+
+			# Enemy bullets: every overlapping one goes
+			clashed = False
+			for enemy_slot in range(self.count[enemy]):
+				if abs(x - self.x.item(enemy, enemy_slot)) < BULLET_SIZE and abs(y - self.y.item(enemy, enemy_slot)) < BULLET_SIZE:
+					enemy_bullets.append(enemy_slot)
+					clashed = True
+			if not clashed:
+				keep[-1] = True
+		return keep, tank_hit, eagles_hit, bricks, enemy_bullets
+
+	def collide_vectorized(self, owner, enemy_tank):
+		# Same rules and result as collide_each, one pass over all bullets per kind of obstacle
+		game = self.game
+		game_map = game.map
+		count = self.count[owner]
+		x, y, dy = self.x[owner, :count], self.y[owner, :count], self.dy[owner, :count]
+
+		# Off screen
+		active = (x >= 0) & (x <= game.SCREEN_WIDTH) & (y >= 0) & (y <= game.SCREEN_HEIGHT)
+
+		# Enemy tank
+		tx, ty, tw, th = enemy_tank.x, enemy_tank.y, enemy_tank.width, enemy_tank.height
+		hit = active & (x >= tx - BULLET_SIZE) & (x <= tx + tw) & (y >= ty - BULLET_SIZE) & (y <= ty + th)
+		tank_hit = bool(hit.any())
+		active &= ~hit
+
+		# Eagles
+		eagles = []
+		hit = np.zeros_like(active)
+		for index, (ex, ey) in enumerate(game_map.eagles.positions):
+			if not game_map.eagles.destroyed[index]:
+				overlap = active & (x < ex + EAGLE_SIZE) & (x + BULLET_SIZE > ex) & (y < ey + EAGLE_SIZE) & (y + BULLET_SIZE > ey)
+				if overlap.any():
+					eagles.append(index)
+					hit |= overlap
+		active &= ~hit
+
+		# Bricks
+		vertical = dy != 0
+		bound, bricks = game_map.bricks_in_damage_bounds_batch(
+			np.where(vertical, x - 12, x), np.where(vertical, y, y - 12), np.where(vertical, 32, 16), np.where(vertical, 16, 32)
 		)
+		hit = active[bound]
+		bricks = bricks[hit].tolist()
+		active[bound[hit]] = False
+
+		# Steel walls
+		active &= ~game_map.box_hits_batch(x, y, BULLET_SIZE, STEEL)
+
+		# Enemy bullets
+		ex, ey = self.positions(1 - owner)
+		clash = active[:, None] & (np.abs(x[:, None] - ex) < BULLET_SIZE) & (np.abs(y[:, None] - ey) < BULLET_SIZE)
+		active &= ~clash.any(axis=1)
+		return active, tank_hit, eagles, bricks, np.flatnonzero(clash.any(axis=0))
+
+	def keep(self, owner, mask):
+		# Drop the bullets outside mask, the survivors stay in firing order
+		count = int(mask.sum())
+		for array in (self.x, self.y, self.dx, self.dy):
+			array[owner, :count] = array[owner, :len(mask)][mask]
+		self.count[owner] = count
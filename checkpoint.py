@@ -0,0 +1,73 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+# Read once at import: os.umask can only be queried by setting it, which is not thread safe
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def save_atomically(state_dict, path):
+	# Write next to the target and rename, readers never see a half-written checkpoint
+	fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+	os.close(fd)
+	try:
+		torch.save(state_dict, temp_path)
+		os.chmod(temp_path, 0o666 & ~UMASK)  # mkstemp makes it owner-only, give it the mode a plain open would
+		os.replace(temp_path, path)
+	except BaseException:
+		os.remove(temp_path)
+		raise
+
+
+def load_checkpoint(path):
+	# Plain tensors only, onto the CPU whatever device saved them
+	return torch.load(path, map_location="cpu", weights_only=True)
+
+
+class CheckpointManager:
+	"""Persists networks every `every_rounds` rounds or `every_seconds` seconds, whichever comes first.
+
+	Weights stay in memory between rounds. A save takes a detached copy of the state dicts and
+	hands it to a background thread, which writes each file atomically; flush() waits for it.
+	"""
+
+	def __init__(self, every_rounds=20, every_seconds=120.0):
+		self.every_rounds = every_rounds
+		self.every_seconds = every_seconds
+		self.rounds_since_save = 0
+		self.last_save_time = time.time()
+		self.executor = ThreadPoolExecutor(max_workers=1)
+		self.pending = []
+
+	def round_finished(self, targets):
+		# targets: [(module, path)]; saves only when the interval has passed
+		self.rounds_since_save += 1
+		if (
+			(self.every_rounds and self.rounds_since_save >= self.every_rounds)
+			or (self.every_seconds and time.time() - self.last_save_time >= self.every_seconds)
+		):
+			self.save(targets)
+
+	def save(self, targets):
+		snapshot = [
+			(path, {key: value.detach().clone() for key, value in module.state_dict().items()})
+			for module, path in targets
+		]
+		self.pending = [future for future in self.pending if not future.done()]
+		self.pending.append(self.executor.submit(self.write, snapshot))
+		self.rounds_since_save = 0
+		self.last_save_time = time.time()
+
+	def write(self, snapshot):
+		for path, state_dict in snapshot:
+			save_atomically(state_dict, path)
+
+	def flush(self):
+		# Wait for queued saves and surface their errors
+		for future in self.pending:
+			future.result()
+		self.pending = []
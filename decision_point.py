@@ -1,4 +1,6 @@
 class DecisionPoint:
+	__slots__ = ("x", "y", "index")
+
 	def __init__(self, x, y, index):
 		self.x = x
 		self.y = y
@@ -1,26 +1,59 @@
+import time
+_import_start = time.perf_counter()
 import sys
 import os
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 import pygame
-import time
+import random
+import torch
 
-from agent import Agent
+from agent import Agent, decide_actions
 from tank import Tank
+from bullet import BulletPool
 from map import Map
+from observation import ObservationEncoder, PlaneObservationEncoder
+from checkpoint import CheckpointManager
+from profiling import PhaseTimer, RoundProfiler
+IMPORT_SECONDS = time.perf_counter() - _import_start  # pygame, torch and the game modules, when game is imported first
 
 
 class Game:
-	def __init__(self, headless=False, agent1_file=None, agent2_file=None, max_iterations=1):
+	def __init__(self, headless=False, agent1_file=None, agent2_file=None, max_iterations=1, fixed_timestep=None, observation_mode="flat", shared_with=None, persist_models=True, instrument=False, seed=None):
 		self.headless = headless
-		self.agent1_file = agent1_file or "policies/agent1_policy_merged.pth"
-		self.agent2_file = agent2_file or "policies/agent2_policy_merged.pth"
+		# Randomness: the game's RNG draws one seed per round (spawns, action sampling) and seeds the
+		# networks; with seed=None every run differs
+		self.seed = seed
+		self.rng = random.Random(seed)
+		self.torch_rng = torch.Generator()
+		self.torch_rng.manual_seed(self.rng.getrandbits(63))  # PPO minibatch order
+		self.round_seed = None
+		self.round_rng = None
+		self.recorder = None  # EpisodeRecorder set by record_episodes
+		self.replaying = False  # Actions come from a recording (replay.py), no policy, no learning
+		self.shared_with = shared_with  # Game whose agents' networks and optimizers this game trains too
+		self.persist_models = persist_models  # False when the weights are exchanged in memory (train_parallel)
+		self.checkpoints = CheckpointManager(every_rounds=20, every_seconds=120.0)
+		self.timer = PhaseTimer(enabled=instrument)  # Per-phase timings, can be switched on and off at runtime
+		self.profiler = None  # RoundProfiler set by profile_rounds
+		self.rounds_played = 0
+		# Headless runs step a simulated clock as fast as possible instead of waiting on the wall clock
+		self.fixed_timestep = headless if fixed_timestep is None else fixed_timestep
+		# "flat": per-entity feature vector and PolicyNetwork, "planes": 26x26 tile planes and ConvPolicyNetwork
+		self.observation_mode = observation_mode
+		self.policy_name = "conv_policy" if observation_mode == "planes" else "policy"  # Keeps checkpoints of the two apart
+		self.agent1_file = agent1_file or f"policies/agent1_{self.policy_name}_merged.pth"
+		self.agent2_file = agent2_file or f"policies/agent2_{self.policy_name}_merged.pth"
 		self.iteration_limit = max_iterations if self.headless else None
+		#self.stage_file = os.path.join(os.path.dirname(__file__), "stages/stage0.txt")
+		self.stage_file = os.path.join(os.path.dirname(__file__), "stages/no-obstacles.txt")
 
 		# Time
 		self.timeElapsed = 0
 		self.start_time = time.time()
 		self.max_time = 12  # Seconds per game
 		self.clock = pygame.time.Clock()
+		self.sim_tick = 0  # Frames simulated so far (fixed timestep mode)
+		self.start_tick = 0
 
 		# Game Variables & Agents
 		self.initialized = False
@@ -30,21 +63,49 @@ class Game:
 		self.tanks = []
 		self.tank1 = None
 		self.tank2 = None
+		self.bullet_pool = BulletPool(self)  # Both tanks' bullets, see Tank.bullets
 		self.agents = []
 		self.agent1 = None
 		self.agent2 = None
+		self.encoder = None
 		self.agent_points = {
 			'agent_1': 0,
 			'agent_2': 0,
 		}
 		self.round_has_ended = False
 		self.training_cycle_count = 0
+		self.rounds_per_train = 5  # Rounds collected before each training pass
+		self.actor_threads = None  # torch threads while playing and while training, None keeps torch's default
+		self.learner_threads = None
+		self.state = None  # Latest observation returned by reset()/step()
+		self.distance = None  # Tank distance at that observation, for step rewards
 
 		# Constants
 		self.SCREEN_WIDTH, self.SCREEN_HEIGHT = 832, 832  # 26x26 grid of 32x32 tiles
 		self.TILE_SIZE = 32
 		self.FPS = 60
 		self.ASSET_PATH = os.path.join(os.path.dirname(__file__), "assets/images")
+		self.TANK_SIZE = 52
+		self.IMAGES = None
+		self.tank1_images = None
+		self.tank2_images = None
+		self.startup_times = {"imports": IMPORT_SECONDS}  # Seconds per startup phase, see print_startup_times
+
+		# Initialize Pygame: headless runs on the simulated clock need no pygame subsystem at all
+		started = time.perf_counter()
+		if not (self.headless and self.fixed_timestep):
+			pygame.init()
+		self.startup_times["pygame_init"] = time.perf_counter() - started
+
+		# Initialize Window
+		if not self.headless:
+			self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+			pygame.display.set_caption("Battle City Clone")
+			self.load_assets()
+
+	def load_assets(self):
+		# Images are only needed for drawing, headless games never load them
+		started = time.perf_counter()
 		self.IMAGES = {
 			"#": pygame.image.load(os.path.join(self.ASSET_PATH, "brick.png")),
 			"S": pygame.image.load(os.path.join(self.ASSET_PATH, "steel.png")),
@@ -52,7 +113,6 @@ class Game:
 			"B": pygame.image.load(os.path.join(self.ASSET_PATH, "eagle.png")),
 			"C": pygame.image.load(os.path.join(self.ASSET_PATH, "eagle-destroyed.png")),
 		}
-		self.TANK_SIZE = 52
 
 		# Preloaded tank images
 		self.tank1_images = {
@@ -67,20 +127,37 @@ class Game:
 			"LEFT": pygame.image.load(os.path.join(self.ASSET_PATH, "tank2-left.png")),
 			"RIGHT": pygame.image.load(os.path.join(self.ASSET_PATH, "tank2-right.png")),
 		}
+		self.startup_times["assets"] = time.perf_counter() - started
 
-		# Initialize Pygame
-		pygame.init()
-
-		# Initialize Window
-		if not self.headless:
-			self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
-			pygame.display.set_caption("Battle City Clone")
+	def print_startup_times(self):
+		phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.startup_times.items())
+		print(f"⏱️ Startup: {phases}")
 
 	def close_application(self):
 		self.running = False
+		self.stop_recording()
 		pygame.quit()
 		sys.exit()
 
+	def get_ticks(self):
+		# Milliseconds since start, counted in frames when running on the simulated clock
+		if self.fixed_timestep:
+			return self.sim_tick * 1000 // self.FPS
+		return pygame.time.get_ticks()
+
+	def get_time_elapsed(self):
+		if self.fixed_timestep:
+			return round((self.sim_tick - self.start_tick) / self.FPS)
+		return round(time.time() - self.start_time)
+
+	def advance_clock(self):
+		if self.fixed_timestep:
+			self.sim_tick += 1  # No throttling headless, run as fast as the machine allows
+			if not self.headless:
+				self.clock.tick(self.FPS)
+		else:
+			self.clock.tick(self.FPS)
+
 	def print_agent_points(self):
 		print(f"Iteration: {self.iteration}, Agent 1: {self.agent_points['agent_1']}, Agent 2: {self.agent_points['agent_2']}")
 
@@ -107,6 +184,7 @@ class Game:
 				"direction_to_opponent": self.tank1.get_direction_to_opponent_onehot(),
 				"destroyed": self.tank1.destroyed,
 				"has_line_of_sight": self.tank1.has_line_of_sight_to_opponent(),
+				"has_line_of_sight_to_eagle": self.tank1.has_line_of_sight_to_eagle(),
 			},
 			"tank2": {
 				"x_norm": tank2_x_norm,
@@ -119,6 +197,7 @@ class Game:
 				"direction_to_opponent": self.tank2.get_direction_to_opponent_onehot(),
 				"destroyed": self.tank2.destroyed,
 				"has_line_of_sight": self.tank2.has_line_of_sight_to_opponent(),
+				"has_line_of_sight_to_eagle": self.tank2.has_line_of_sight_to_eagle(),
 			},
 			"eagles": [{"x": eagle["x"], "y": eagle["y"], "destroyed": eagle["destroyed"]} for eagle in self.map.eagles],
 			"bricks": [{"x": brick["x"], "y": brick["y"], "destroyed": brick["destroyed"]} for brick in self.map.bricks],
@@ -127,36 +206,57 @@ class Game:
 		}
 		return state
 
-	def save_and_load_models(self):
-		if self.headless:
+	def save_models(self, force=False):
+		# Networks stay in memory across rounds, this only publishes them for merge_policies,
+		# every few rounds (or right away with force) and on a background thread
+		if self.headless and self.persist_models and self.shared_with is None:
 			process_id = os.getpid()
-			self.agent1_file = f"policies/agent1_policy_{process_id}.pth"
-			self.agent2_file = f"policies/agent2_policy_{process_id}.pth"
-
-			self.agent1.save_model(self.agent1_file)
-			self.agent2.save_model(self.agent2_file)
-
-			self.agent1.load_model(self.agent1_file)
-			self.agent2.load_model(self.agent2_file)
+			self.agent1_file = f"policies/agent1_{self.policy_name}_{process_id}.pth"
+			self.agent2_file = f"policies/agent2_{self.policy_name}_{process_id}.pth"
+
+			targets = [(self.agent1.policy_net, self.agent1_file), (self.agent2.policy_net, self.agent2_file)]
+			if force:
+				self.checkpoints.save(targets)
+			else:
+				self.checkpoints.round_finished(targets)
+
+	def finish_saving(self):
+		# Publish the final weights and wait until they are on disk
+		if self.initialized:
+			self.save_models(force=True)
+		self.checkpoints.flush()
+		self.stop_recording()
+
+	def assign_eagles(self):
+		# Each tank guards the eagle closest to its spawn
+		self.tank1.eagle = min(self.map.eagles, key=lambda eagle: ((self.tank1.x - eagle["x"]) ** 2 + (self.tank1.y - eagle["y"]) ** 2) ** 0.5)
+		self.tank2.eagle = min(self.map.eagles, key=lambda eagle: ((self.tank2.x - eagle["x"]) ** 2 + (self.tank2.y - eagle["y"]) ** 2) ** 0.5)
 
 	def init_game(self):
+		started = time.perf_counter()
 		# Use merged as starting model if they exist
-		if os.path.exists("policies/agent1_policy_merged.pth"):
-			self.agent1_file = "policies/agent1_policy_merged.pth"
-		if os.path.exists("policies/agent2_policy_merged.pth"):
-			self.agent2_file = "policies/agent2_policy_merged.pth"
+		if os.path.exists(f"policies/agent1_{self.policy_name}_merged.pth"):
+			self.agent1_file = f"policies/agent1_{self.policy_name}_merged.pth"
+		if os.path.exists(f"policies/agent2_{self.policy_name}_merged.pth"):
+			self.agent2_file = f"policies/agent2_{self.policy_name}_merged.pth"
+		if self.replaying:
+			self.agent1_file = self.agent2_file = None  # Replays never run the networks
 
 		# Setup Tanks
 		self.start_time = time.time()  # Reset start time when game starts
-		#self.map = Map(self, os.path.join(os.path.dirname(__file__), "stages/stage0.txt"))
-		self.map = Map(self, os.path.join(os.path.dirname(__file__), "stages/no-obstacles.txt"))
+		self.start_tick = self.sim_tick
+		self.begin_round()
+		self.map = Map(self, self.stage_file)
 		self.tanks = []
 		self.tank1 = Tank(self, *self.map.tank1_pos, self.tank1_images)
 		self.tank2 = Tank(self, *self.map.tank2_pos, self.tank2_images)
 		self.tank1.opponent = self.tank2
 		self.tank2.opponent = self.tank1
-		self.tank1.eagle = min(self.map.eagles, key=lambda eagle: ((self.tank1.x - eagle["x"]) ** 2 + (self.tank1.y - eagle["y"]) ** 2) ** 0.5)
-		self.tank2.eagle = min(self.map.eagles, key=lambda eagle: ((self.tank2.x - eagle["x"]) ** 2 + (self.tank2.y - eagle["y"]) ** 2) ** 0.5)
+		self.assign_eagles()
+		if self.observation_mode == "planes":
+			self.encoder = PlaneObservationEncoder(self)
+		else:
+			self.encoder = ObservationEncoder(self)
 
 		# Setup Agents
 		self.agents = []
@@ -168,33 +268,156 @@ class Game:
 		self.agent1.opponent = self.tank2
 		self.agent2.opponent = self.tank1
 
-		self.agent1.setup_model(0.001, self.agent1_file)
-		self.agent2.setup_model(0.002, self.agent2_file)
-
-		# Save and Load Models
-		self.save_and_load_models()
+		if self.shared_with:
+			if not self.shared_with.initialized:
+				self.shared_with.init_game()
+			self.agent1.setup_model(shared_agent=self.shared_with.agent1)
+			self.agent2.setup_model(shared_agent=self.shared_with.agent2)
+		else:
+			self.agent1.setup_model(0.001, self.agent1_file)
+			self.agent2.setup_model(0.002, self.agent2_file)
 
 		# Game is Fully Initialized
 		self.initialized = True
+		self.startup_times["init_game"] = time.perf_counter() - started
+		self.observe()
+
+	def observe(self):
+		# Snapshot the encoded observation returned by reset()/step()
+		self.state = self.encoder.encode().copy()
+		self.distance = self.agent1.get_distance()
+		return self.state
+
+	def reset(self, round_seed=None):
+		# Start a new round in place: map, tanks and per-round agent state are restored,
+		# networks, optimizers and memory are kept. round_seed replays a recorded round.
+		if not self.initialized:
+			self.init_game()
+			return self.state
+
+		self.start_time = time.time()
+		self.start_tick = self.sim_tick
+		self.timeElapsed = 0
+		self.begin_round(round_seed)
+		self.map.reset()
+		self.tank1.reset(*self.map.tank1_pos)
+		self.tank2.reset(*self.map.tank2_pos)
+		self.assign_eagles()
+		for agent in self.agents:
+			agent.reset()
+
+		return self.observe()
+
+	def begin_round(self, round_seed=None):
+		# Everything random within a round comes from round_rng, so (round seed, actions) reproduce it
+		self.round_seed = self.rng.getrandbits(32) if round_seed is None else round_seed
+		self.round_rng = random.Random(self.round_seed)
+		if self.recorder:
+			self.recorder.begin_round(self.round_seed, self.start_tick, os.path.basename(self.stage_file))
+
+	def record_episodes(self, path):
+		# Log every round from now on to a binary episode file (see replay.py)
+		from replay import EpisodeRecorder
+		self.recorder = EpisodeRecorder(path)
+
+	def stop_recording(self):
+		# Close the episode file; the round in progress is not written
+		if self.recorder:
+			self.recorder.close()
+			self.recorder = None
+
+	def outcome_flags(self):
+		# Bits: tank1 destroyed, tank2 destroyed, tank1's eagle destroyed, tank2's eagle destroyed, time out
+		return (
+			self.tank1.destroyed
+			| self.tank2.destroyed << 1
+			| self.tank1.eagle["destroyed"] << 2
+			| self.tank2.eagle["destroyed"] << 3
+			| (self.timeElapsed >= self.max_time) << 4
+		)
+
+	def apply_action(self, tank, action):
+		# Agent action encoding: 0-3 move UP/DOWN/LEFT/RIGHT, 4 shoots, None stands still
+		if action is None or tank.destroyed:
+			return
+		if action == 4:
+			tank.shoot()
+		else:
+			tank.perform_action(self.agent1.map_action_to_keys(action), tank.opponent)
+
+	def step(self, action1, action2):
+		# Advance one frame with explicit actions for both tanks -> (obs, rewards, done, info).
+		# The round is not reset automatically, call reset() once done is True.
+		if not self.initialized:
+			self.init_game()
+
+		self.timeElapsed = self.get_time_elapsed()
+		previous_distance = self.distance
+
+		for tank in self.tanks:
+			tank.update()
+		self.apply_action(self.tank1, action1)
+		self.apply_action(self.tank2, action2)
+
+		self.observe()
+		rewards = (
+			self.agent1.compute_step_reward(previous_distance, self.distance),
+			self.agent2.compute_step_reward(previous_distance, self.distance),
+		)
+		done = self.check_done()
+		info = {
+			"timeElapsed": self.timeElapsed,
+			"tank1_destroyed": self.tank1.destroyed,
+			"tank2_destroyed": self.tank2.destroyed,
+			"eagle1_destroyed": self.tank1.eagle["destroyed"],
+			"eagle2_destroyed": self.tank2.eagle["destroyed"],
+		}
+		self.advance_clock()
+		return self.state, rewards, done, info
 
 	def train(self):
 		self.iteration += 1
 		#self.print_agent_points()
+		if self.learner_threads:
+			torch.set_num_threads(self.learner_threads)
 		for agent in self.agents:
 			agent.train()
+		if self.actor_threads:
+			torch.set_num_threads(self.actor_threads)
 
 	def round_over(self):
+		if self.recorder and not self.round_has_ended:
+			self.recorder.end_round(self.sim_tick - self.start_tick, self.outcome_flags())
+		if self.replaying:
+			self.round_has_ended = True  # The replayer starts the next recorded round itself
+			return
+
+		started = self.timer.start()
 		if self.headless:
 			if self.round_has_ended:
 				return  # Prevent multiple calls per round
 
 			self.round_has_ended = True  # Lock
 			self.training_cycle_count += 1
-			if self.training_cycle_count >= 5:
+			if self.training_cycle_count >= self.rounds_per_train:
 				self.train()
 				self.training_cycle_count = 0
+				started = self.timer.lap("train", started)
+
+		self.reset()
+		started = self.timer.lap("reset", started)
+		self.save_models()
+		self.timer.lap("save", started)
+
+		self.rounds_played += 1
+		if self.profiler:
+			self.profiler.on_round(self.rounds_played)
 
-		self.init_game()
+	def profile_rounds(self, num_rounds, first_round=None, path="profile.pstats"):
+		# cProfile the given window of rounds (from the current one by default) and dump it to path
+		first_round = self.rounds_played if first_round is None else first_round
+		self.profiler = RoundProfiler(first_round, num_rounds, path)
+		self.profiler.on_round(self.rounds_played)
 
 	def check_done(self):
 		return (
@@ -204,6 +427,15 @@ class Game:
 		)
 
 	def update(self):
+		pending = self.begin_update()
+		if pending:
+			started = self.timer.start()
+			decide_actions(pending)
+			self.timer.lap("decide", started)
+		self.end_update()
+
+	def begin_update(self):
+		# First half of a frame, up to the point where agents need decisions; returns those agents
 		# Initialize game if not initialized yet.
 		if not self.initialized:
 			self.init_game()
@@ -211,24 +443,37 @@ class Game:
 		# Reset once at the start of the new round
 		if self.round_has_ended:
 			self.round_has_ended = False
+		if self.recorder:
+			self.recorder.mark_frame(self.sim_tick)
 
-		# Handle Key Presses and Events
-		for event in pygame.event.get():
-			if event.type == pygame.QUIT:
-				self.close_application()
-			if event.type == pygame.KEYDOWN:
-				if event.key == pygame.K_ESCAPE:
+		started = self.timer.start()
+		# Handle Key Presses and Events (headless games have no window to send any)
+		if not self.headless:
+			for event in pygame.event.get():
+				if event.type == pygame.QUIT:
 					self.close_application()
-				if event.key == pygame.K_r:
-					self.init_game()
-
-		# Update tanks (really just updates bullets...)
+				if event.type == pygame.KEYDOWN:
+					if event.key == pygame.K_ESCAPE:
+						self.close_application()
+					if event.key == pygame.K_r:
+						self.reset()
+			started = self.timer.lap("events", started)
+
+		# Update tanks: bullets first, then the decision point lookup (Tank.update, timed apart)
 		for tank in self.tanks:
-			tank.update()
+			tank.update_bullets(tank.opponent)
+		started = self.timer.lap("bullets", started)
+		for tank in self.tanks:
+			tank.update_decision_point()
+		self.timer.lap("decision_point", started)
+
+		# Agents observe, decisions are made in one batch by the caller
+		return [agent for agent in self.agents if agent.prepare_update()]
 
-		# Update Agents
+	def end_update(self):
+		# Second half of a frame: agents act on their decisions
 		for agent in self.agents:
-			agent.update()
+			agent.finish_update()
 
 		# ✅ Centralized game-over check
 		if self.check_done() and not self.round_has_ended:
@@ -263,14 +508,16 @@ class Game:
 	# Main game loop
 	def main(self):
 		while self.running and (self.iteration_limit is None or self.iteration < self.iteration_limit):
-			self.timeElapsed = round(time.time() - self.start_time)
+			self.timeElapsed = self.get_time_elapsed()
 			self.update()
 			self.draw()
-			self.clock.tick(self.FPS)
+			self.advance_clock()
 
 		# Automatically stop headless mode after iteration limit is reached
 		if self.headless:
 			self.running = False
+			self.finish_saving()
+		self.stop_recording()
 
 
 if __name__ == "__main__":
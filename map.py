@@ -1,12 +1,201 @@
+import os
 import pygame
-import random
+import numpy as np
 from decision_point import DecisionPoint
 
+GRID_SIZE = 26  # Stages are 26x26 tiles
+EAGLE_SIZE = 64  # Eagles cover 2x2 tiles
+
+# Tile codes used in StageTemplate.tiles
+EMPTY, BRICK, STEEL, EAGLE_A, EAGLE_B, TANK1_SPAWN, TANK2_SPAWN = range(7)
+
+# Decision points form a 13x13 lattice on the odd tiles
+DECISION_POINTS_PER_ROW = GRID_SIZE // 2
+NEIGHBOR_DIRECTIONS = ("UP", "DOWN", "LEFT", "RIGHT")  # Column order of StageTemplate.decision_point_neighbors
+TILE_CODES = {" ": EMPTY, "#": BRICK, "S": STEEL, "A": EAGLE_A, "B": EAGLE_B, "1": TANK1_SPAWN, "2": TANK2_SPAWN}
+# Tiles around a tile edge crossing, in the order bricks_in_damage_bounds checks them
+CORNER_ROWS = np.array([-1, -1, 0, 0])
+CORNER_COLS = np.array([-1, 0, -1, 0])
+
+# Tank spawn centers, one is drawn at random per round
+TANK1_STARTING_POSITIONS = [
+	[32, 800],
+	[96, 800],
+	[160, 800],
+	[224, 800],
+	[288, 800],
+	[544, 800],
+	[608, 800],
+	[672, 800],
+	[736, 800],
+	[800, 800],
+]
+TANK2_STARTING_POSITIONS = [
+	[32, 32],
+	[96, 32],
+	[160, 32],
+	[224, 32],
+	[288, 32],
+	[544, 32],
+	[608, 32],
+	[672, 32],
+	[736, 32],
+	[800, 32],
+]
+
+
+class StageTemplate:
+	"""A stage file compiled once into read-only arrays, shared by every Map that uses it."""
+
+	def __init__(self, stage_file, tile_size):
+		self.stage_file = stage_file
+		self.tile_size = tile_size
+		self.tiles = np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.uint8)
+		bricks, steel_walls, eagles = [], [], []
+
+		with open(stage_file, "r") as f:
+			for row_index, line in enumerate(f):
+				for col_index, tile in enumerate(line.rstrip()):
+					if row_index < GRID_SIZE and col_index < GRID_SIZE:
+						self.tiles[row_index, col_index] = TILE_CODES.get(tile, EMPTY)
+					if tile == "#":
+						bricks.append((col_index * tile_size, row_index * tile_size))
+					elif tile == "S":
+						steel_walls.append((col_index * tile_size, row_index * tile_size))
+					elif tile == "A" or tile == "B":
+						eagles.append((col_index * tile_size, row_index * tile_size, tile))
+
+		self.brick_xy = np.array(bricks, dtype=np.int64).reshape(-1, 2)
+		self.steel_xy = np.array(steel_walls, dtype=np.int64).reshape(-1, 2)
+
+		# Initial occupancy grid (bricks and steel only) and the brick list index of every brick tile
+		self.occupancy = np.where((self.tiles == BRICK) | (self.tiles == STEEL), self.tiles, EMPTY).astype(np.uint8)
+		# The same as bitmasks per row (bit = column) and per column (bit = row), see Map.line_clear
+		bits = 1 << np.arange(GRID_SIZE, dtype=np.int64)
+		self.row_masks = tuple(int(mask) for mask in ((self.occupancy != EMPTY) * bits).sum(axis=1))
+		self.col_masks = tuple(int(mask) for mask in ((self.occupancy != EMPTY) * bits[:, None]).sum(axis=0))
+		self.brick_index = np.full((GRID_SIZE, GRID_SIZE), -1, dtype=np.int64)
+		self.brick_index[self.brick_xy[:, 1] // tile_size, self.brick_xy[:, 0] // tile_size] = np.arange(len(self.brick_xy))
+		self.eagles = tuple(eagles)  # (x, y, type)
+		self.eagle_xy = np.array([(x, y) for x, y, _ in eagles], dtype=np.int64).reshape(-1, 2)
+		self.eagle_types = tuple(tile for _, _, tile in eagles)
+		# The same coordinates as tuples of Python ints, for scalar loops
+		self.brick_positions = tuple(bricks)
+		self.steel_positions = tuple(steel_walls)
+		self.eagle_positions = tuple((x, y) for x, y, _ in eagles)
+		self.has_tank1_spawn = bool((self.tiles == TANK1_SPAWN).any())
+		self.has_tank2_spawn = bool((self.tiles == TANK2_SPAWN).any())
+
+		# Decision points sit on the odd tiles of the grid, DecisionPoint objects are never mutated
+		decision_points = []
+		for y in range(GRID_SIZE):
+			if y % 2 != 0:
+				for x in range(GRID_SIZE):
+					if x % 2 != 0:
+						decision_points.append(DecisionPoint(tile_size * y, tile_size * x, len(decision_points)))
+		self.decision_points = tuple(decision_points)
+		self.decision_point_xy = np.array([(dp.x, dp.y) for dp in decision_points], dtype=np.int64)
+
+		# Lattice neighbours of every decision point (index = column * 13 + row), -1 off the lattice
+		per_row = DECISION_POINTS_PER_ROW
+		index = np.arange(len(decision_points))
+		column, row = index // per_row, index % per_row
+		self.decision_point_neighbors = np.stack([
+			np.where(row > 0, index - 1, -1),
+			np.where(row < per_row - 1, index + 1, -1),
+			np.where(column > 0, index - per_row, -1),
+			np.where(column < per_row - 1, index + per_row, -1),
+		], axis=1)
+
+		for array in (self.tiles, self.brick_xy, self.steel_xy, self.eagle_xy, self.occupancy, self.brick_index, self.decision_point_xy, self.decision_point_neighbors):
+			array.flags.writeable = False
+
+
+_stage_templates = {}
+
+
+def load_stage_template(stage_file, tile_size=32):
+	# Stages are parsed once per process, later Maps and resets reuse the template
+	key = (os.path.abspath(stage_file), tile_size)
+	template = _stage_templates.get(key)
+	if template is None:
+		template = StageTemplate(stage_file, tile_size)
+		_stage_templates[key] = template
+	return template
+
+
+class TileView:
+	"""One tile of a TileArrays, read like the dicts maps used to hold: tile["x"], tile["destroyed"]."""
+
+	__slots__ = ("tiles", "index", "x", "y")
+
+	def __init__(self, tiles, index):
+		self.tiles = tiles
+		self.index = index
+		self.x, self.y = tiles.positions[index]
+
+	def __getitem__(self, key):
+		if key == "destroyed":
+			return bool(self.tiles.destroyed[self.index])
+		if key == "x":
+			return self.x
+		if key == "y":
+			return self.y
+		if key == "width" or key == "height":
+			return self.tiles.size
+		if key == "type" and self.tiles.types:
+			return self.tiles.types[self.index]
+		raise KeyError(key)
+
+	def __repr__(self):
+		return f"<Tile x={self.x}, y={self.y}, destroyed={self['destroyed']}>"
+
+
+class TileArrays:
+	"""Bricks, steel walls or eagles of a map as typed arrays.
+
+	x, y and positions come from the StageTemplate and are shared, destroyed is the map's own bool
+	array. Indexing or iterating yields TileViews.
+	"""
+
+	__slots__ = ("x", "y", "positions", "destroyed", "size", "types", "_views")
+
+	def __init__(self, xy, positions, size, types=None):
+		self.x = xy[:, 0]
+		self.y = xy[:, 1]
+		self.positions = positions
+		self.destroyed = np.zeros(len(xy), dtype=bool)
+		self.size = size
+		self.types = types
+		self._views = None
+
+	def views(self):
+		# Built on first use, headless training only ever touches the arrays
+		if self._views is None:
+			self._views = tuple(TileView(self, index) for index in range(len(self.positions)))
+		return self._views
+
+	def __len__(self):
+		return len(self.positions)
+
+	def __getitem__(self, index):
+		return self.views()[index]
+
+	def __iter__(self):
+		return iter(self.views())
+
 
 class Map:
 	def __init__(self, game, stage_file):
 		self.game = game
-		self.tiles = []
+		self.stage_file = stage_file
+		self.template = None
+		self.tiles = None
+		self.grid = None  # Occupancy of every tile: BRICK, STEEL or EMPTY once a brick is destroyed
+		self.row_masks = []  # Occupied tiles of every row as a bitmask over columns, kept in step with grid
+		self.col_masks = []  # ... and of every column over rows
+		self.changes = []  # ("brick" | "eagle", index) destroyed since the last reset, in order
+		self.generation = 0  # Bumped on every reset, consumers of `changes` rebuild when it moves
 		self.bricks = []
 		self.steel_walls = []
 		self.eagles = []
@@ -16,71 +205,160 @@ class Map:
 		self.load_stage(stage_file)
 
 	def load_stage(self, stage_file):
-		with open(stage_file, "r") as f:
-			for row_index, line in enumerate(f):
-				row = []
-				for col_index, tile in enumerate(line.rstrip()):
-					if tile == "#":
-						self.bricks.append({
-							"x": col_index * self.game.TILE_SIZE,
-							"y": row_index * self.game.TILE_SIZE,
-							"destroyed": False
-						})
-					elif tile == "S":
-						self.steel_walls.append({
-							"x": col_index * self.game.TILE_SIZE,
-							"y": row_index * self.game.TILE_SIZE
-						})
-					elif tile == "A" or tile == "B":
-						self.eagles.append({
-							"x": col_index * self.game.TILE_SIZE,
-							"y": row_index * self.game.TILE_SIZE,
-							"width": 64,  # Set eagle collision box width
-							"height": 64,  # Set eagle collision box height
-							"type": tile,
-							"destroyed": False  # Intact initially
-						})
-					elif tile == "2":
-						# self.tank2_pos = (544 - self.game.TANK_SIZE / 2, 32 - self.game.TANK_SIZE / 2)
-						starting_positions = [
-							[32, 32],
-							[96, 32],
-							[160, 32],
-							[224, 32],
-							[288, 32],
-							[544, 32],
-							[608, 32],
-							[672, 32],
-							[736, 32],
-							[800, 32],
-						]
-						rand_pos = random.choice(starting_positions)
-						self.tank2_pos = (
-							rand_pos[0] - self.game.TANK_SIZE / 2,
-							rand_pos[1] - self.game.TANK_SIZE / 2
-						)
-					elif tile == "1":
-						#self.tank1_pos = (288 - self.game.TANK_SIZE / 2, 800 - self.game.TANK_SIZE / 2)
-						starting_positions = [
-							[32, 800],
-							[96, 800],
-							[160, 800],
-							[224, 800],
-							[288, 800],
-							[544, 800],
-							[608, 800],
-							[672, 800],
-							[736, 800],
-							[800, 800],
-						]
-						rand_pos = random.choice(starting_positions)
-						self.tank1_pos = (
-							rand_pos[0] - self.game.TANK_SIZE / 2,
-							rand_pos[1] - self.game.TANK_SIZE / 2
-						)
-					row.append(tile)
-				self.tiles.append(row)
+		self.template = load_stage_template(stage_file, self.game.TILE_SIZE)
+		self.tiles = self.template.tiles
+		self.grid = self.template.occupancy.copy()
+		self.row_masks = list(self.template.row_masks)
+		self.col_masks = list(self.template.col_masks)
+		tile_size = self.game.TILE_SIZE
+		template = self.template
+		self.bricks = TileArrays(template.brick_xy, template.brick_positions, tile_size)
+		self.steel_walls = TileArrays(template.steel_xy, template.steel_positions, tile_size)
+		self.eagles = TileArrays(template.eagle_xy, template.eagle_positions, EAGLE_SIZE, template.eagle_types)
 		self.generate_decision_points()
+		self.draw_spawns()
+
+	def random_spawn(self, starting_positions):
+		rand_pos = self.game.round_rng.choice(starting_positions)
+		return (
+			rand_pos[0] - self.game.TANK_SIZE / 2,
+			rand_pos[1] - self.game.TANK_SIZE / 2
+		)
+
+	def draw_spawns(self):
+		if self.template.has_tank1_spawn:
+			#self.tank1_pos = (288 - self.game.TANK_SIZE / 2, 800 - self.game.TANK_SIZE / 2)
+			self.tank1_pos = self.random_spawn(TANK1_STARTING_POSITIONS)
+		if self.template.has_tank2_spawn:
+			# self.tank2_pos = (544 - self.game.TANK_SIZE / 2, 32 - self.game.TANK_SIZE / 2)
+			self.tank2_pos = self.random_spawn(TANK2_STARTING_POSITIONS)
+
+	def reset(self):
+		# Only the destroyed flags change during a round, everything else comes from the template
+		self.bricks.destroyed[:] = False
+		self.eagles.destroyed[:] = False
+		np.copyto(self.grid, self.template.occupancy)
+		self.row_masks[:] = self.template.row_masks
+		self.col_masks[:] = self.template.col_masks
+		self.changes = []
+		self.generation += 1
+		self.draw_spawns()
+
+	def destroy_brick(self, index):
+		self.bricks.destroyed[index] = True
+		x, y = self.bricks.positions[index]
+		row, col = y // self.game.TILE_SIZE, x // self.game.TILE_SIZE
+		self.grid[row, col] = EMPTY
+		self.row_masks[row] &= ~(1 << col)
+		self.col_masks[col] &= ~(1 << row)
+		self.changes.append(("brick", index))
+
+	def destroy_eagle(self, index):
+		self.eagles.destroyed[index] = True
+		self.changes.append(("eagle", index))
+
+	def _tile_span(self, start, size):
+		# Tiles a [start, start + size) interval overlaps, clamped to the grid
+		first = max(int(start // self.game.TILE_SIZE), 0)
+		last = min(int(-(-(start + size) // self.game.TILE_SIZE)) - 1, GRID_SIZE - 1)
+		return first, last
+
+	def box_hits(self, x, y, width, height, tile=None):
+		# Does the box overlap a brick or steel tile (or only tiles of the given code)?
+		c0, c1 = self._tile_span(x, width)
+		r0, r1 = self._tile_span(y, height)
+		if c0 > c1 or r0 > r1:
+			return False
+		cells = self.grid[r0:r1 + 1, c0:c1 + 1]
+		if tile is None:
+			return bool(cells.any())
+		return bool((cells == tile).any())
+
+	def box_hits_batch(self, x, y, size, tile):
+		# box_hits over arrays of square boxes no larger than a tile (so spanning at most 2x2 tiles)
+		tile_size = self.game.TILE_SIZE
+		c0 = np.maximum(x // tile_size, 0).astype(np.int64)
+		c1 = np.minimum(-(-(x + size) // tile_size) - 1, GRID_SIZE - 1).astype(np.int64)
+		r0 = np.maximum(y // tile_size, 0).astype(np.int64)
+		r1 = np.minimum(-(-(y + size) // tile_size) - 1, GRID_SIZE - 1).astype(np.int64)
+		inside = (c0 <= c1) & (r0 <= r1)
+		c0, r0 = np.minimum(c0, GRID_SIZE - 1), np.minimum(r0, GRID_SIZE - 1)
+		c1, r1 = np.maximum(c1, 0), np.maximum(r1, 0)
+		grid = self.grid
+		hits = (grid[r0, c0] == tile) | (grid[r0, c1] == tile) | (grid[r1, c0] == tile) | (grid[r1, c1] == tile)
+		return inside & hits
+
+	def bricks_in_damage_bounds(self, x, y, width, height):
+		# Indices of intact bricks with a corner inside the (half-open) damage bounds
+		tile_size = self.game.TILE_SIZE
+		line_x = -(-x // tile_size)  # First tile edge inside the bounds
+		line_y = -(-y // tile_size)
+		if line_x * tile_size >= x + width or line_y * tile_size >= y + height:
+			return []
+		hits = []
+		for row in (int(line_y) - 1, int(line_y)):
+			for col in (int(line_x) - 1, int(line_x)):
+				if 0 <= row < GRID_SIZE and 0 <= col < GRID_SIZE and self.grid[row, col] == BRICK:
+					hits.append(int(self.template.brick_index[row, col]))
+		return hits
+
+	def bricks_in_damage_bounds_batch(self, x, y, width, height):
+		# bricks_in_damage_bounds over arrays of bounds -> (bound, brick index) pairs, bound-major
+		tile_size = self.game.TILE_SIZE
+		line_x = (-(-x // tile_size)).astype(np.int64)
+		line_y = (-(-y // tile_size)).astype(np.int64)
+		has_corner = (line_x * tile_size < x + width) & (line_y * tile_size < y + height)
+		rows = line_y[:, None] + CORNER_ROWS
+		cols = line_x[:, None] + CORNER_COLS
+		valid = has_corner[:, None] & (rows >= 0) & (rows < GRID_SIZE) & (cols >= 0) & (cols < GRID_SIZE)
+		bound, corner = np.nonzero(valid)
+		rows, cols = rows[bound, corner], cols[bound, corner]
+		brick = self.grid[rows, cols] == BRICK
+		return bound[brick], self.template.brick_index[rows[brick], cols[brick]]
+
+	def obstacle_at(self, x, y):
+		# Is the point inside (or on the edge of) a brick or steel tile?
+		tile_size = self.game.TILE_SIZE
+		col, row = int(x // tile_size), int(y // tile_size)
+		cols = (col - 1, col) if x % tile_size == 0 else (col,)
+		rows = (row - 1, row) if y % tile_size == 0 else (row,)
+		for r in rows:
+			for c in cols:
+				if 0 <= r < GRID_SIZE and 0 <= c < GRID_SIZE and self.grid[r, c] != EMPTY:
+					return True
+		return False
+
+	def _walk_mask(self, start, stop):
+		# Bitmask of the tiles obstacle_at probes at start, start +- TILE_SIZE, ... short of stop
+		tile_size = self.game.TILE_SIZE
+		start, stop = int(start), int(stop)
+		if start == stop:
+			return 0
+		if stop > start:
+			low, high = start, start + (stop - start - 1) // tile_size * tile_size
+		else:
+			low, high = start - (start - stop - 1) // tile_size * tile_size, start
+		first_tile = max(low // tile_size - (low % tile_size == 0), 0)
+		last_tile = min(high // tile_size, GRID_SIZE - 1)
+		if first_tile > last_tile:
+			return 0
+		return (1 << (last_tile + 1)) - (1 << first_tile)
+
+	def line_clear(self, x1, y1, x2, y2):
+		# No brick or steel on the straight line from (x1, y1) towards (x2, y2), which must share a row or
+		# a column. Probes the same tiles as stepping obstacle_at a tile at a time, in constant time.
+		if x1 == x2:
+			mask, across, masks = self._walk_mask(y1, y2), x1, self.col_masks
+		else:
+			mask, across, masks = self._walk_mask(x1, x2), y1, self.row_masks
+		if not mask:
+			return True
+		# The line runs along one tile, or between two when it lies on a tile edge
+		tile_size = self.game.TILE_SIZE
+		tile = int(across // tile_size)
+		if 0 <= tile < GRID_SIZE and masks[tile] & mask:
+			return False
+		return not (across % tile_size == 0 and 0 < tile <= GRID_SIZE and masks[tile - 1] & mask)
 
 	def draw(self):
 		# Draw Bricks
@@ -110,11 +388,31 @@ class Map:
 		})
 
 	def generate_decision_points(self):
-		count = 0
-		for y in range(26):
-			if y % 2 != 0:
-				for x in range(26):
-					if x % 2 != 0:
-						dp = DecisionPoint(self.game.TILE_SIZE * y, self.game.TILE_SIZE * x, count)
-						count = count + 1
-						self.decision_points.append(dp)
+		self.decision_points = list(self.template.decision_points)
+
+	def decision_point_near(self, x, y, radius=2):
+		# The lattice point closest to (x, y) is the only candidate, no need to scan all of them
+		spacing = 2 * self.game.TILE_SIZE
+		column = round((x - self.game.TILE_SIZE) / spacing)
+		row = round((y - self.game.TILE_SIZE) / spacing)
+		if 0 <= column < DECISION_POINTS_PER_ROW and 0 <= row < DECISION_POINTS_PER_ROW:
+			dp = self.decision_points[column * DECISION_POINTS_PER_ROW + row]
+			if dp.is_near(x, y, radius):
+				return dp
+		return False
+
+	def get_reachable_decision_points(self, index, size=None):
+		# {direction: DecisionPoint} for the lattice neighbours a tank centered on decision point
+		# `index` can drive to without touching a brick or steel tile on the way
+		half = (size or self.game.TANK_SIZE) / 2
+		start = self.decision_points[index]
+		reachable = {}
+		for direction, neighbor in zip(NEIGHBOR_DIRECTIONS, self.template.decision_point_neighbors[index].tolist()):
+			if neighbor < 0:
+				continue
+			end = self.decision_points[neighbor]
+			x, y = min(start.x, end.x) - half, min(start.y, end.y) - half
+			width, height = abs(end.x - start.x) + 2 * half, abs(end.y - start.y) + 2 * half
+			if not self.box_hits(x, y, width, height):
+				reachable[direction] = end
+		return reachable
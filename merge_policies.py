@@ -2,9 +2,33 @@ import torch
 import os
 import tempfile
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from checkpoint import save_atomically
 
-def merge_policies(pattern, output_file):
+
+def load_state_dict(path):
+	# mmap keeps the file paged in by the OS instead of read up front (torch >= 2.1, zip checkpoints)
+	try:
+		return torch.load(path, map_location="cpu", mmap=True)
+	except (TypeError, RuntimeError):
+		return torch.load(path, map_location="cpu")
+
+
+def stream_state_dicts(paths, num_threads=4):
+	# Yields the state dicts in order, at most num_threads loaded ahead at a time
+	with ThreadPoolExecutor(max_workers=num_threads) as executor:
+		pending = deque()
+		for path in paths:
+			pending.append(executor.submit(load_state_dict, path))
+			if len(pending) >= num_threads:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+
+def merge_policies(pattern, output_file, num_threads=4):
 	files = [
 		f for f in os.listdir("policies")
 		if f.startswith(pattern) and f.endswith(".pth") and "merged" not in f
@@ -14,19 +38,31 @@ def merge_policies(pattern, output_file):
 		return
 
 	print(f"🔄 Merging {len(files)} files into {output_file}")
-	state_dicts = [torch.load(os.path.join("policies", f)) for f in files]
-	avg_state = {}
+	start = time.time()
+	paths = [os.path.join("policies", f) for f in files]
+	total_bytes = sum(os.path.getsize(path) for path in paths)
 
-	for key in state_dicts[0]:
-		avg_state[key] = sum(d[key] for d in state_dicts) / len(state_dicts)
+	# Running sum in one preallocated float64 accumulator, one file in memory per loader thread
+	accumulator = None
+	dtypes = {}
+	for state_dict in stream_state_dicts(paths, num_threads):
+		if accumulator is None:
+			dtypes = {key: value.dtype for key, value in state_dict.items()}
+			accumulator = {key: value.to(torch.float64, copy=True) for key, value in state_dict.items()}
+		else:
+			for key, value in accumulator.items():
+				value.add_(state_dict[key])
+		del state_dict
 
-	torch.save(avg_state, os.path.join("policies", output_file))
-	print(f"✅ Saved merged model to {output_file}")
+	avg_state = {key: value.div_(len(paths)).to(dtypes[key]) for key, value in accumulator.items()}
+	save_atomically(avg_state, os.path.join("policies", output_file))
+	elapsed = max(time.time() - start, 1e-9)
+	print(f"✅ Saved merged model to {output_file} ({len(paths) / elapsed:.1f} files/s, {total_bytes / elapsed / 1e6:.1f} MB/s)")
 
 	# 🧹 Delete only the originals, NOT the merged file
-	for f in files:
-		os.remove(os.path.join("policies", f))
-		#print(f"🗑️ Deleted {f}")
+	for path in paths:
+		os.remove(path)
+		#print(f"🗑️ Deleted {path}")
 	print("🗑️ Deleted policy files")
 
 
@@ -55,4 +91,8 @@ def clean_temp_files(prefixes, older_than_seconds=300):
 if __name__ == "__main__":
 	merge_policies("agent1_policy_", "agent1_policy_merged.pth")
 	merge_policies("agent2_policy_", "agent2_policy_merged.pth")
+	# Policies trained with observation_mode="planes"
+	if any(f.startswith("agent1_conv_policy_") for f in os.listdir("policies")):
+		merge_policies("agent1_conv_policy_", "agent1_conv_policy_merged.pth")
+		merge_policies("agent2_conv_policy_", "agent2_conv_policy_merged.pth")
 	clean_temp_files(prefixes=["agent1_policy_", "agent2_policy_", "torch_", "mp-"])
@@ -0,0 +1,232 @@
+import numpy as np
+
+from map import EMPTY, BRICK, STEEL
+from bullet import BULLET_SIZE
+
+TANK_FEATURES = 19  # x, y, rel_dx, rel_dy, direction (4), distance, direction to opponent (8), destroyed, line of sight
+DIRECTION_INDEX = {"UP": 0, "DOWN": 1, "LEFT": 2, "RIGHT": 3}
+
+
+class ObservationEncoder:
+	"""Writes the flat agent observation straight from the game objects into one reusable float32 buffer.
+
+	The layout is fixed per stage and matches what the policy networks were trained on:
+	tank1, tank1 bullets, tank2, tank2 bullets, eagles (x, y, destroyed), bricks (x, y, destroyed), steel walls (x, y).
+	Everything from the eagles on is the static block: it is rebuilt after a map reset and
+	otherwise only patched for the entries in Map.changes.
+	"""
+
+	def __init__(self, game, max_bullets=50, max_eagles=2):
+		self.game = game
+		self.max_bullets = max_bullets
+		self.max_eagles = max_eagles
+		self.num_bricks = len(game.map.bricks)
+		self.num_steel_walls = len(game.map.steel_walls)
+
+		# Offsets of every block in the flat vector
+		self.tank1_offset = 0
+		self.tank1_bullets_offset = self.tank1_offset + TANK_FEATURES
+		self.tank2_offset = self.tank1_bullets_offset + 2 * max_bullets
+		self.tank2_bullets_offset = self.tank2_offset + TANK_FEATURES
+		self.eagles_offset = self.tank2_bullets_offset + 2 * max_bullets
+		self.bricks_offset = self.eagles_offset + 3 * max_eagles
+		self.steel_walls_offset = self.bricks_offset + 3 * self.num_bricks
+		self.size = self.steel_walls_offset + 2 * self.num_steel_walls
+
+		self.static_offset = self.eagles_offset
+
+		self.buffer = np.zeros(self.size, dtype=np.float32)
+		self._map = None
+		self._generation = None
+		self._cursor = 0
+		self.write_static_features()
+
+	def write_static_features(self):
+		# Brick, steel and eagle coordinates never move, they are written once
+		width, height = self.game.SCREEN_WIDTH, self.game.SCREEN_HEIGHT
+		template = self.game.map.template
+		bricks = self.buffer[self.bricks_offset:self.steel_walls_offset].reshape(-1, 3)
+		bricks[:, 0] = template.brick_xy[:, 0] / width
+		bricks[:, 1] = template.brick_xy[:, 1] / height
+		steel_walls = self.buffer[self.steel_walls_offset:self.size].reshape(-1, 2)
+		steel_walls[:, 0] = template.steel_xy[:, 0] / width
+		steel_walls[:, 1] = template.steel_xy[:, 1] / height
+		self._brick_rows = template.brick_xy[:, 1] // self.game.TILE_SIZE
+		self._brick_cols = template.brick_xy[:, 0] // self.game.TILE_SIZE
+
+		eagles = self.buffer[self.eagles_offset:self.bricks_offset]
+		eagles[:] = 0
+		for i, (x, y) in enumerate(self.game.map.eagles.positions[:self.max_eagles]):
+			eagles[3 * i] = x / width
+			eagles[3 * i + 1] = y / height
+
+	def encode(self):
+		# Refresh the buffer for the current frame; it is overwritten by the next call
+		game = self.game
+		tank1, tank2 = game.tank1, game.tank2
+		buffer = self.buffer
+
+		x1, y1 = tank1.get_normalized_xy_coordinates()
+		x2, y2 = tank2.get_normalized_xy_coordinates()
+		distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
+		self.write_tank(self.tank1_offset, tank1, x1, y1, x2 - x1, y2 - y1, distance)
+		self.write_tank(self.tank2_offset, tank2, x2, y2, x1 - x2, y1 - y2, distance)
+		self.write_bullets(self.tank1_bullets_offset, tank1)
+		self.write_bullets(self.tank2_bullets_offset, tank2)
+
+		self.sync_static_features()
+		return buffer
+
+	def sync_static_features(self):
+		game_map = self.game.map
+		changes = game_map.changes
+		if game_map is not self._map or game_map.generation != self._generation:
+			# New round: rewrite every destroyed flag
+			destroyed = game_map.eagles.destroyed[:self.max_eagles]
+			self.buffer[self.eagles_offset + 2:self.eagles_offset + 3 * len(destroyed):3] = destroyed
+			if self.num_bricks:
+				self.buffer[self.bricks_offset + 2:self.steel_walls_offset:3] = game_map.grid[self._brick_rows, self._brick_cols] == EMPTY
+			self._map = game_map
+			self._generation = game_map.generation
+		else:
+			# Same round: destroyed flags only ever flip to 1
+			for kind, index in changes[self._cursor:]:
+				slot = self.static_slot(kind, index)
+				if slot is not None:
+					self.buffer[slot] = 1
+		self._cursor = len(changes)
+
+	def static_slot(self, kind, index):
+		# Buffer index of the destroyed flag a Map.changes entry touches
+		if kind == "brick":
+			return self.bricks_offset + 3 * index + 2
+		if kind == "eagle" and index < self.max_eagles:
+			return self.eagles_offset + 3 * index + 2
+		return None
+
+	def write_tank(self, offset, tank, x_norm, y_norm, rel_dx, rel_dy, distance):
+		buffer = self.buffer
+		buffer[offset] = x_norm
+		buffer[offset + 1] = y_norm
+		buffer[offset + 2] = rel_dx
+		buffer[offset + 3] = rel_dy
+		buffer[offset + 4:offset + 17] = 0
+		buffer[offset + 4 + DIRECTION_INDEX[tank.direction]] = 1
+		buffer[offset + 8] = distance
+		buffer[offset + 9 + tank.get_direction_to_opponent_sector()] = 1
+		buffer[offset + 17] = tank.destroyed
+		buffer[offset + 18] = tank.has_line_of_sight_to_opponent()
+
+	def write_bullets(self, offset, tank):
+		buffer = self.buffer
+		buffer[offset:offset + 2 * self.max_bullets] = 0
+		if not self.game.bullet_pool.count[tank.index]:
+			return
+		x, y = self.game.bullet_pool.positions(tank.index)
+		for bullet_x, bullet_y in zip(x[:self.max_bullets].tolist(), y[:self.max_bullets].tolist()):
+			buffer[offset] = bullet_x / self.game.SCREEN_WIDTH
+			buffer[offset + 1] = bullet_y / self.game.SCREEN_HEIGHT
+			offset += 2
+
+
+# Planes of PlaneObservationEncoder
+BRICK_PLANE, STEEL_PLANE, EAGLE_PLANE, TANK1_PLANE, TANK2_PLANE, TANK1_BULLET_PLANE, TANK2_BULLET_PLANE = range(7)
+NUM_PLANES = 7
+TANK_SCALARS = 8  # x, y, direction (4), destroyed, line of sight
+NUM_SCALARS = 2 * TANK_SCALARS + 2  # both tanks, distance, fraction of the round elapsed
+
+
+class PlaneObservationEncoder:
+	"""Encodes the board as 26x26 tile planes plus a short scalar vector, one flat float32 buffer.
+
+	The size is the same for every stage: NUM_PLANES * 26 * 26 planes followed by NUM_SCALARS
+	scalars (see ConvPolicyNetwork). Bricks, steel and eagles follow Map.changes like
+	ObservationEncoder, tanks and bullets are redrawn every frame.
+	"""
+
+	def __init__(self, game):
+		self.game = game
+		self.grid_size = game.map.grid.shape[0]
+		self.num_planes = NUM_PLANES
+		self.num_scalars = NUM_SCALARS
+		self.plane_size = NUM_PLANES * self.grid_size * self.grid_size
+		self.size = self.plane_size + NUM_SCALARS
+
+		self.buffer = np.zeros(self.size, dtype=np.float32)
+		self.planes = self.buffer[:self.plane_size].reshape(NUM_PLANES, self.grid_size, self.grid_size)
+		self.scalars = self.buffer[self.plane_size:]
+		self._map = None
+		self._generation = None
+		self._cursor = 0
+
+		self.planes[STEEL_PLANE] = game.map.template.occupancy == STEEL
+
+	def encode(self):
+		game = self.game
+		tank1, tank2 = game.tank1, game.tank2
+		self.sync_static_planes()
+
+		# Tanks and bullets
+		self.planes[TANK1_PLANE:] = 0
+		self.mark_box(TANK1_PLANE, tank1.x, tank1.y, tank1.width, tank1.height)
+		self.mark_box(TANK2_PLANE, tank2.x, tank2.y, tank2.width, tank2.height)
+		self.mark_bullets(TANK1_BULLET_PLANE, tank1)
+		self.mark_bullets(TANK2_BULLET_PLANE, tank2)
+
+		# Scalars
+		x1, y1 = tank1.get_normalized_xy_coordinates()
+		x2, y2 = tank2.get_normalized_xy_coordinates()
+		self.write_tank(0, tank1, x1, y1)
+		self.write_tank(TANK_SCALARS, tank2, x2, y2)
+		self.scalars[2 * TANK_SCALARS] = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
+		self.scalars[2 * TANK_SCALARS + 1] = game.timeElapsed / game.max_time
+		return self.buffer
+
+	def sync_static_planes(self):
+		game_map = self.game.map
+		changes = game_map.changes
+		if game_map is not self._map or game_map.generation != self._generation:
+			self.planes[BRICK_PLANE] = game_map.grid == BRICK
+			self.planes[EAGLE_PLANE] = 0
+			eagles = game_map.eagles
+			for index, (x, y) in enumerate(eagles.positions):
+				if not eagles.destroyed[index]:
+					self.mark_box(EAGLE_PLANE, x, y, eagles.size, eagles.size)
+			self._map = game_map
+			self._generation = game_map.generation
+		else:
+			tile_size = self.game.TILE_SIZE
+			for kind, index in changes[self._cursor:]:
+				if kind == "brick":
+					x, y = game_map.bricks.positions[index]
+					self.planes[BRICK_PLANE, y // tile_size, x // tile_size] = 0
+				else:
+					x, y = game_map.eagles.positions[index]
+					self.mark_box(EAGLE_PLANE, x, y, game_map.eagles.size, game_map.eagles.size, 0)
+		self._cursor = len(changes)
+
+	def mark_box(self, plane, x, y, width, height, value=1):
+		# Set every tile the box overlaps
+		tile_size = self.game.TILE_SIZE
+		c0, c1 = max(int(x // tile_size), 0), min(int(-(-(x + width) // tile_size)), self.grid_size)
+		r0, r1 = max(int(y // tile_size), 0), min(int(-(-(y + height) // tile_size)), self.grid_size)
+		self.planes[plane, r0:r1, c0:c1] = value
+
+	def mark_bullets(self, plane, tank):
+		# Tile under each bullet's center
+		if not self.game.bullet_pool.count[tank.index]:
+			return
+		x, y = self.game.bullet_pool.positions(tank.index)
+		cols = ((x + BULLET_SIZE / 2) // self.game.TILE_SIZE).astype(np.int64)
+		rows = ((y + BULLET_SIZE / 2) // self.game.TILE_SIZE).astype(np.int64)
+		inside = (rows >= 0) & (rows < self.grid_size) & (cols >= 0) & (cols < self.grid_size)
+		self.planes[plane, rows[inside], cols[inside]] = 1
+
+	def write_tank(self, offset, tank, x_norm, y_norm):
+		scalars = self.scalars
+		scalars[offset] = x_norm
+		scalars[offset + 1] = y_norm
+		scalars[offset + 2:offset + 6] = 0
+		scalars[offset + 2 + DIRECTION_INDEX[tank.direction]] = 1
+		scalars[offset + 6] = tank.destroyed
+		scalars[offset + 7] = tank.has_line_of_sight_to_opponent()
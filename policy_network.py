@@ -10,10 +10,124 @@ class PolicyNetwork(nn.Module):
 		self.fc2 = nn.Linear(256, 256)
 		self.fc3 = nn.Linear(256, 128)
 		self.fc4 = nn.Linear(128, action_dim)  # Match action_dim to the number of possible actions
+		self.value_head = nn.Linear(128, 1)  # State value for GAE, shares the trunk with the policy
 
 	def forward(self, x):
-		x = F.relu(self.fc1(x))
+		return self.head(self.fc1(x))
+
+	def forward_with_value(self, x):
+		# (probabilities, values) from one pass
+		return self.head_with_value(self.fc1(x))
+
+	def trunk(self, x):
+		# Everything after fc1's affine map up to the heads, so fc1 can be evaluated in parts
+		x = F.relu(x)
 		x = F.relu(self.fc2(x))
-		x = F.relu(self.fc3(x))
-		x = F.softmax(self.fc4(x), dim=-1)  # Output probabilities
-		return x
+		return F.relu(self.fc3(x))
+
+	def head(self, x):
+		return F.softmax(self.fc4(self.trunk(x)), dim=-1)  # Output probabilities
+
+	def head_with_value(self, x):
+		features = self.trunk(x)
+		return F.softmax(self.fc4(features), dim=-1), self.value_head(features).squeeze(-1)
+
+
+class ConvPolicyNetwork(nn.Module):
+	"""Compact policy over PlaneObservationEncoder observations: the same input size on every stage."""
+
+	def __init__(self, num_planes, num_scalars, action_dim, grid_size=26):
+		super(ConvPolicyNetwork, self).__init__()
+		self.num_planes = num_planes
+		self.grid_size = grid_size
+		self.plane_size = num_planes * grid_size * grid_size
+		self.conv1 = nn.Conv2d(num_planes, 8, kernel_size=2, stride=2)  # 26 -> 13, one cell per decision point
+		self.conv2 = nn.Conv2d(8, 16, kernel_size=3, stride=2, padding=1)  # 13 -> 7
+		conv_size = (grid_size // 2 + 1) // 2
+		self.fc1 = nn.Linear(16 * conv_size * conv_size + num_scalars, 128)
+		self.fc2 = nn.Linear(128, action_dim)
+		self.value_head = nn.Linear(128, 1)
+
+	def forward(self, x):
+		return F.softmax(self.fc2(self.trunk(x)), dim=-1)  # Output probabilities
+
+	def forward_with_value(self, x):
+		features = self.trunk(x)
+		return F.softmax(self.fc2(features), dim=-1), self.value_head(features).squeeze(-1)
+
+	def trunk(self, x):
+		# x: (batch, planes * 26 * 26 + scalars), the flat buffer of PlaneObservationEncoder
+		planes = x[:, :self.plane_size].reshape(-1, self.num_planes, self.grid_size, self.grid_size)
+		scalars = x[:, self.plane_size:]
+		planes = F.relu(self.conv1(planes))
+		planes = F.relu(self.conv2(planes))
+		x = torch.cat([planes.flatten(1), scalars], dim=1)
+		return F.relu(self.fc1(x))
+
+
+class StaticInputCache:
+	"""Caches fc1's contribution from the static block of the observation (eagles, bricks, steel).
+
+	The contribution is patched from Map.changes as bricks and eagles are destroyed and recomputed
+	after a map reset or whenever fc1's weights change, so a forward pass only multiplies the
+	dynamic tank and bullet features.
+	"""
+
+	def __init__(self, network, encoder):
+		self.network = network
+		self.encoder = encoder
+		self.static_offset = encoder.static_offset
+		self.contribution = None
+		self.static_input = None
+		self._map = None
+		self._generation = None
+		self._cursor = 0
+		self._weight_version = None
+
+	def __call__(self, observation):
+		# observation: the encoded vector for the current frame, shape (input_dim,)
+		with torch.no_grad():
+			contribution = self.refresh(observation)
+			fc1 = self.network.fc1
+			hidden = F.linear(observation[:self.static_offset], fc1.weight[:, :self.static_offset], fc1.bias) + contribution
+			return self.network.head(hidden)
+
+	@staticmethod
+	def forward_batch(caches, observations):
+		# One forward for a batch of observations of different games sharing a network, one cache per game
+		# -> (probabilities, values)
+		with torch.no_grad():
+			network = caches[0].network
+			offset = caches[0].static_offset
+			contributions = torch.stack([cache.refresh(observation) for cache, observation in zip(caches, observations)])
+			hidden = F.linear(observations[:, :offset], network.fc1.weight[:, :offset], network.fc1.bias) + contributions
+			return network.head_with_value(hidden)
+
+	def refresh(self, observation):
+		# Bring the cached contribution up to date with the map and the weights, and return it
+		fc1 = self.network.fc1
+		offset = self.static_offset
+		static = observation[offset:]
+		game_map = self.encoder.game.map
+
+		with torch.no_grad():
+			if (
+				self.contribution is None
+				or fc1.weight._version != self._weight_version
+				or game_map is not self._map
+				or game_map.generation != self._generation
+			):
+				self.contribution = torch.mv(fc1.weight[:, offset:], static)
+				self.static_input = static.clone()
+				self._map = game_map
+				self._generation = game_map.generation
+				self._weight_version = fc1.weight._version
+			elif len(game_map.changes) > self._cursor:
+				slots = [self.encoder.static_slot(kind, index) for kind, index in game_map.changes[self._cursor:]]
+				slots = torch.tensor([slot - offset for slot in slots if slot is not None], dtype=torch.long)
+				if len(slots):
+					delta = static[slots] - self.static_input[slots]
+					self.contribution += torch.mv(fc1.weight[:, offset + slots], delta)
+					self.static_input[slots] = static[slots]
+			self._cursor = len(game_map.changes)
+		return self.contribution
@@ -0,0 +1,118 @@
+import cProfile
+import math
+import pstats
+import time
+
+NUM_BUCKETS = 32  # Bucket i holds durations in [2^i, 2^(i+1)) microseconds
+
+
+class PhaseHistogram:
+	"""Durations of one phase: count, total, max and a log2 histogram in microseconds."""
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+		self.buckets = [0] * NUM_BUCKETS
+
+	def add(self, seconds):
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+		microseconds = seconds * 1e6
+		bucket = int(math.log2(microseconds)) if microseconds >= 1 else 0
+		self.buckets[min(bucket, NUM_BUCKETS - 1)] += 1
+
+	def merge(self, other):
+		self.count += other.count
+		self.total += other.total
+		self.max = max(self.max, other.max)
+		self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+	def percentile(self, fraction):
+		# Upper edge of the bucket holding the given fraction of samples, in seconds
+		target = fraction * self.count
+		seen = 0
+		for bucket, count in enumerate(self.buckets):
+			seen += count
+			if count and seen >= target:
+				return 2 ** (bucket + 1) / 1e6
+		return self.max
+
+
+class PhaseTimer:
+	"""Times the phases of a frame (Game.update, Agent.update, Game.round_over) into histograms.
+
+	Call sites chain laps: started = timer.start(); ...; started = timer.lap("phase", started).
+	When disabled start() returns None and lap() returns right away, so switching it off at
+	runtime leaves two cheap calls per phase.
+	"""
+
+	def __init__(self, enabled=False):
+		self.enabled = enabled
+		self.phases = {}
+
+	def start(self):
+		return time.perf_counter() if self.enabled else None
+
+	def lap(self, phase, started):
+		# Record the time since started under phase and return the start of the next phase
+		if started is None:
+			return None
+		now = time.perf_counter()
+		histogram = self.phases.get(phase)
+		if histogram is None:
+			histogram = self.phases[phase] = PhaseHistogram()
+		histogram.add(now - started)
+		return now
+
+	@classmethod
+	def from_phases(cls, phases):
+		timer = cls()
+		timer.phases = phases
+		return timer
+
+	def reset(self):
+		self.phases = {}
+
+	def merge(self, other):
+		# Aggregate another timer's phases, e.g. the ones sent back by train_parallel workers
+		for phase, histogram in other.phases.items():
+			self.phases.setdefault(phase, PhaseHistogram()).merge(histogram)
+
+	def print_report(self, title="Phase timings"):
+		grand_total = sum(histogram.total for histogram in self.phases.values()) or 1.0
+		print(f"⏱️ {title}")
+		for phase, histogram in sorted(self.phases.items(), key=lambda item: -item[1].total):
+			mean = histogram.total / histogram.count
+			print(
+				f"  {phase:<18} {histogram.total:8.3f}s {100 * histogram.total / grand_total:5.1f}%"
+				f"  n={histogram.count:<8} mean {mean * 1e6:8.1f}us"
+				f"  p50 <{histogram.percentile(0.5) * 1e6:.0f}us  p99 <{histogram.percentile(0.99) * 1e6:.0f}us"
+			)
+
+
+class RoundProfiler:
+	"""cProfile over a window of rounds: from round `first_round` for `num_rounds` rounds, dumped to `path`."""
+
+	def __init__(self, first_round, num_rounds, path="profile.pstats"):
+		self.first_round = first_round
+		self.last_round = first_round + num_rounds
+		self.path = path
+		self.profiler = None
+
+	def on_round(self, round_number):
+		# Called at the start of every round
+		if round_number == self.first_round:
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		elif round_number == self.last_round and self.profiler:
+			self.stop()
+
+	def stop(self):
+		self.profiler.disable()
+		self.profiler.dump_stats(self.path)
+		print(f"📈 Saved profile of rounds {self.first_round}-{self.last_round - 1} to {self.path}")
+		pstats.Stats(self.path).sort_stats("cumulative").print_stats(15)
+		self.profiler = None
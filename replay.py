@@ -0,0 +1,119 @@
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"BCEP"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+# Per round: round seed, tick of the reset, tick of the first frame, frames, outcome flags (Game.outcome_flags),
+# stage name length, decision count
+ROUND_HEADER = struct.Struct("<IIIIBBI")
+
+
+class EpisodeRecorder:
+	"""Appends every round to a compact binary file.
+
+	A round is its header (ROUND_HEADER), the stage file name and one byte per decision:
+	agent index in the high nibble, action in the low one. With the round seed that is
+	everything needed to re-simulate the round, see replay_file.
+	"""
+
+	def __init__(self, path):
+		self.file = open(path, "wb")
+		self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+		self.round = None
+		self.first_tick = None
+		self.decisions = bytearray()
+
+	def begin_round(self, round_seed, start_tick, stage_name):
+		self.round = (round_seed, start_tick, stage_name.encode())
+		self.first_tick = None
+		self.decisions = bytearray()
+
+	def mark_frame(self, tick):
+		# Called every frame; the first one after the reset may come a tick later (reset inside a frame)
+		if self.first_tick is None:
+			self.first_tick = tick
+
+	def record_decision(self, agent_index, action):
+		self.decisions.append(agent_index << 4 | action)
+
+	def end_round(self, frames, outcome):
+		if self.round is None or self.first_tick is None:
+			return
+		round_seed, start_tick, stage_name = self.round
+		self.file.write(ROUND_HEADER.pack(round_seed, start_tick, self.first_tick, frames, outcome, len(stage_name), len(self.decisions)))
+		self.file.write(stage_name)
+		self.file.write(self.decisions)
+		self.file.flush()  # Rounds are whole on disk even if the process never closes the recorder
+		self.round = None
+
+	def close(self):
+		self.file.close()
+
+
+def read_episodes(path):
+	# Yields (round_seed, start_tick, first_tick, frames, outcome, stage_name, decisions) per recorded round
+	with open(path, "rb") as f:
+		data = f.read()
+	magic, version = FILE_HEADER.unpack_from(data)
+	if magic != MAGIC or version != VERSION:
+		raise ValueError(f"{path} is not a version {VERSION} episode file")
+	offset = FILE_HEADER.size
+	while offset < len(data):
+		round_seed, start_tick, first_tick, frames, outcome, name_length, num_decisions = ROUND_HEADER.unpack_from(data, offset)
+		offset += ROUND_HEADER.size
+		stage_name = data[offset:offset + name_length].decode()
+		offset += name_length
+		decisions = data[offset:offset + num_decisions]
+		offset += num_decisions
+		yield round_seed, start_tick, first_tick, frames, outcome, stage_name, decisions
+
+
+def replay_round(game, round_seed, start_tick, first_tick, decisions):
+	# Re-simulate one round with the recorded actions -> (frames, outcome flags)
+	game.sim_tick = start_tick  # Round time and shot cooldowns follow the clock, so it is restored too
+	game.reset(round_seed)
+	game.sim_tick = first_tick
+	game.round_has_ended = False
+	queue = iter(decisions)
+	while True:
+		game.timeElapsed = game.get_time_elapsed()
+		for agent in game.begin_update():
+			decision = next(queue, None)
+			if decision is None or decision >> 4 != (0 if agent is game.agent1 else 1):
+				raise ValueError("Recording out of sync with the simulation")
+			agent.apply_decision(decision & 0xF)
+		game.end_update()
+		if game.round_has_ended:
+			return game.sim_tick - start_tick, game.outcome_flags()
+		game.advance_clock()
+
+
+def replay_file(path, stages_path=None):
+	# Replays every round of an episode file headlessly, without any policy inference.
+	# Returns (rounds, mismatches, frames, seconds); a mismatch is a round that did not end the same way.
+	from game import Game
+	stages_path = stages_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "stages")
+	game = None
+	rounds = mismatches = total_frames = 0
+	start = time.perf_counter()
+	for round_seed, start_tick, first_tick, frames, outcome, stage_name, decisions in read_episodes(path):
+		if game is None or os.path.basename(game.stage_file) != stage_name:
+			game = Game(headless=True)
+			game.replaying = True
+			game.stage_file = os.path.join(stages_path, stage_name)
+			game.init_game()
+		replayed_frames, replayed_outcome = replay_round(game, round_seed, start_tick, first_tick, decisions)
+		rounds += 1
+		total_frames += replayed_frames
+		if (replayed_frames, replayed_outcome) != (frames, outcome):
+			mismatches += 1
+	return rounds, mismatches, total_frames, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+	rounds, mismatches, frames, seconds = replay_file(sys.argv[1])
+	print(f"🔁 Replayed {rounds} rounds ({frames} frames) in {seconds:.2f}s, {frames / max(seconds, 1e-9):.0f} fps")
+	print(f"{'❌' if mismatches else '✅'} {mismatches} round(s) ended differently than recorded")
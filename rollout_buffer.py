@@ -0,0 +1,114 @@
+import numpy as np
+import torch
+
+
+def discounted_cumsum(values, dones, discount, bootstrap=0.0, chunk_size=64):
+	"""out[t] = values[t] + discount * (1 - dones[t]) * out[t + 1] along axis 0, out[T] = bootstrap.
+
+	values and dones are (T,) or (T, num_envs). Instead of a Python loop over time the recursion is
+	solved one chunk at a time as a matrix product, chunk_size steps per product; the chunks keep
+	the powers of discount well away from underflow.
+	"""
+	values = np.asarray(values, dtype=np.float64)
+	shape = values.shape
+	values = values.reshape(len(values), -1)
+	dones = np.asarray(dones, dtype=np.float64).reshape(values.shape)
+	out = np.empty_like(values)
+	carry = np.broadcast_to(np.asarray(bootstrap, dtype=np.float64), values.shape[1:]).copy()
+
+	steps = np.arange(chunk_size)
+	powers = discount ** np.maximum(steps[None, :] - steps[:, None], 0) * (steps[None, :] >= steps[:, None])
+	for end in range(len(values), 0, -chunk_size):
+		start = max(end - chunk_size, 0)
+		n = end - start
+		chunk_dones = dones[start:end]
+		# Step j contributes to step i when no episode ends in [i, j - 1]
+		dones_before = np.cumsum(chunk_dones, axis=0) - chunk_dones
+		same_episode = dones_before[:, None, :] == dones_before[None, :, :]
+		weights = powers[:n, :n, None] * same_episode
+		reaches_end = dones_before == dones_before[-1] + chunk_dones[-1]  # No episode end from i to the chunk's end
+		out[start:end] = (
+			np.einsum("ijk,jk->ik", weights, values[start:end])
+			+ (discount ** (n - steps[:n]))[:, None] * reaches_end * carry
+		)
+		carry = out[start]
+	return out.reshape(shape).astype(np.float32)
+
+
+def compute_gae(rewards, values, dones, gamma=0.99, lam=0.95, last_value=0.0):
+	# -> (advantages, returns); time on axis 0, dones[t] marks the step that ended an episode
+	rewards = np.asarray(rewards, dtype=np.float32)
+	values = np.asarray(values, dtype=np.float32)
+	dones = np.asarray(dones, dtype=np.float32)
+	next_values = np.empty_like(values)
+	next_values[:-1] = values[1:]
+	next_values[-1] = last_value
+	deltas = rewards + gamma * (1 - dones) * next_values - values
+	advantages = discounted_cumsum(deltas, dones, gamma * lam)
+	return advantages, advantages + values
+
+
+class RolloutBuffer:
+	"""Fixed-capacity rollout storage in preallocated contiguous arrays, one row per transition.
+
+	Each observation is stored once: the next state of transition i is row i + 1, which is the
+	observation of the following decision. Episode ends are marked in dones. tensors() hands the
+	filled part to the learner as torch views of the arrays, without copying.
+	"""
+
+	def __init__(self, capacity, observation_size):
+		self.capacity = capacity
+		self.observations = np.zeros((capacity + 1, observation_size), dtype=np.float32)  # +1 row for the next state of the last transition
+		self.actions = np.zeros(capacity, dtype=np.int64)
+		self.rewards = np.zeros(capacity, dtype=np.float32)
+		self.dones = np.zeros(capacity, dtype=np.float32)
+		self.log_probs = np.zeros(capacity, dtype=np.float32)
+		self.values = np.zeros(capacity, dtype=np.float32)
+		self.size = 0
+
+	def __len__(self):
+		return self.size
+
+	def next_observation_row(self):
+		# Row the next observation goes into; write the encoder output here to avoid a separate copy
+		return self.observations[self.size]
+
+	def add(self, action, reward, done, log_prob=0.0, value=0.0, observation=None):
+		# Commit a transition whose observation is already in next_observation_row() (or pass it)
+		if self.size >= self.capacity:
+			raise RuntimeError(f"Rollout buffer is full ({self.capacity} transitions), train or clear it first")
+		i = self.size
+		if observation is not None:
+			self.observations[i] = observation
+		self.actions[i] = action
+		self.rewards[i] = reward
+		self.dones[i] = done
+		self.log_probs[i] = log_prob
+		self.values[i] = value
+		self.size += 1
+
+	def end_episode(self):
+		# The following rows belong to a new episode, the last transition gets no next state
+		if self.size:
+			self.dones[self.size - 1] = 1
+
+	def compute_advantages(self, gamma=0.99, lam=0.95, last_value=0.0):
+		# GAE(lambda) over the filled rows, the end of the buffer counts as the end of an episode unless last_value is given
+		n = self.size
+		return compute_gae(self.rewards[:n], self.values[:n], self.dones[:n], gamma, lam, last_value)
+
+	def clear(self):
+		self.size = 0
+
+	def tensors(self):
+		# Views of the filled rows; they alias the buffer, so use them before the next add/clear
+		n = self.size
+		return {
+			"observations": torch.from_numpy(self.observations[:n]),
+			"next_observations": torch.from_numpy(self.observations[1:n + 1]),
+			"actions": torch.from_numpy(self.actions[:n]),
+			"rewards": torch.from_numpy(self.rewards[:n]),
+			"dones": torch.from_numpy(self.dones[:n]),
+			"log_probs": torch.from_numpy(self.log_probs[:n]),
+			"values": torch.from_numpy(self.values[:n]),
+		}
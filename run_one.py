@@ -1,11 +1,20 @@
+import argparse
+
 from game import Game
 import os
 
 if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Play the merged policies against each other")
+	parser.add_argument("--record", metavar="PATH", help="Record every round to a binary episode file (replay with replay.py)")
+	parser.add_argument("--seed", type=int, help="Seed for spawns and action sampling")
+	args = parser.parse_args()
+
 	# Use merged policies
 	agent1_file = "policies/agent1_policy_merged.pth"
 	agent2_file = "policies/agent2_policy_merged.pth"
 
-	# Launch in visual mode
-	game = Game(headless=False, agent1_file=agent1_file, agent2_file=agent2_file)
+	# Launch in visual mode; recordings need the simulated clock to replay, it is still shown at FPS
+	game = Game(headless=False, agent1_file=agent1_file, agent2_file=agent2_file, fixed_timestep=bool(args.record) or None, seed=args.seed)
+	if args.record:
+		game.record_episodes(args.record)
 	game.main()
@@ -0,0 +1,70 @@
+import math
+
+import torch
+
+
+def agent_parameters(game):
+	# (agent, name, parameter) in a fixed order, the layout of a flat parameter vector
+	for agent_name, agent in (("agent1", game.agent1), ("agent2", game.agent2)):
+		for name, parameter in agent.policy_net.named_parameters():
+			yield agent_name, name, parameter
+
+
+def parameter_layout(game):
+	return [(agent_name, name, tuple(parameter.shape)) for agent_name, name, parameter in agent_parameters(game)]
+
+
+def parameters_to_vector(game, vector):
+	# Write both agents' parameters into vector (a row of the shared slots)
+	offset = 0
+	with torch.no_grad():
+		for _, _, parameter in agent_parameters(game):
+			size = parameter.numel()
+			vector[offset:offset + size].copy_(parameter.flatten())
+			offset += size
+
+
+def vector_to_parameters(game, vector):
+	# In-place copy, so optimizers and StaticInputCache (via the weight versions) keep working
+	offset = 0
+	with torch.no_grad():
+		for _, _, parameter in agent_parameters(game):
+			size = parameter.numel()
+			parameter.copy_(vector[offset:offset + size].view_as(parameter))
+			offset += size
+
+
+def vector_to_state_dicts(layout, vector):
+	# {"agent1": state_dict, "agent2": state_dict} from a flat vector, for saving checkpoints
+	state_dicts = {}
+	offset = 0
+	for agent_name, name, shape in layout:
+		size = math.prod(shape)
+		state_dicts.setdefault(agent_name, {})[name] = vector[offset:offset + size].view(shape).clone()
+		offset += size
+	return state_dicts
+
+
+class SharedParameterSlots:
+	"""One row of shared memory per worker plus a last row for the average.
+
+	Workers write their flat parameters into their own row, the coordinator averages the rows
+	into the last one with a single matrix product and workers copy it back. The tensor lives in
+	shared memory and is handed to the workers once over their pipes.
+	"""
+
+	def __init__(self, num_workers, size):
+		self.num_workers = num_workers
+		self.slots = torch.zeros(num_workers + 1, size).share_memory_()
+		self.average = self.slots[-1]
+
+	def worker_slot(self, worker_id):
+		return self.slots[worker_id]
+
+	def average_slots(self, weights=None):
+		# weights: e.g. the steps each worker collected, None for a plain mean
+		if weights is None:
+			weights = torch.ones(self.num_workers)
+		weights = torch.as_tensor(weights, dtype=torch.float32)
+		torch.matmul((weights / weights.sum()).unsqueeze(0), self.slots[:-1], out=self.slots[-1:])
+		return self.average
@@ -1,11 +1,16 @@
 import pygame
 
 from decision_point import DecisionPoint
-from bullet import Bullet
 import math
 
 
 class Tank:
+	__slots__ = (
+		"game", "is_shooting", "x", "y", "width", "height", "images", "direction", "index", "last_shot_time",
+		"opponent", "destroyed", "damage_bounds_rect", "active_keys", "awaiting_decision",
+		"most_recent_decision_point", "temp_decision_point", "eagle",
+	)
+
 	def __init__(self, game, x, y, images):
 		self.game = game
 		self.is_shooting = False  # Track whether the tank is shooting
@@ -15,12 +20,14 @@ class Tank:
 		self.height = 52
 		self.images = images
 		self.direction = "UP"
-		self.bullets = []
+		self.index = len(game.tanks)  # Owner row in the game's BulletPool
+		self.game.bullet_pool.clear(self.index)
 		self.last_shot_time = 0
 		self.opponent = None
 		self.destroyed = False
 		self.game.tanks.append(self)
 		self.damage_bounds_rect = {}
+		self.eagle = None  # Own eagle, a TileView set by Game.assign_eagles
 
 		self.active_keys = None  # current movement keys
 
@@ -28,8 +35,32 @@ class Tank:
 		self.most_recent_decision_point = DecisionPoint(0, 0, 0)
 		self.temp_decision_point = DecisionPoint(0, 0, 0)
 
+	def reset(self, x, y):
+		# Put the tank back on a spawn point for a new round
+		self.is_shooting = False
+		self.x = x
+		self.y = y
+		self.direction = "UP"
+		self.game.bullet_pool.clear(self.index)
+		self.last_shot_time = 0
+		self.destroyed = False
+		self.damage_bounds_rect = {}
+		self.active_keys = None
+		self.awaiting_decision = True
+		self.most_recent_decision_point = DecisionPoint(0, 0, 0)
+		self.temp_decision_point = DecisionPoint(0, 0, 0)
+
+	@property
+	def bullets(self):
+		# Copies of this tank's bullets in firing order; hot paths read bullet_pool.positions instead
+		return self.game.bullet_pool.bullets(self.index)
+
 	def update(self):
-		self.update_bullets(self.game.map.bricks, self.game.map.steel_walls, self.game.map.eagles, self.game.tank2, self.opponent.bullets)
+		self.update_bullets(self.opponent)
+		self.update_decision_point()
+
+	def update_decision_point(self):
+		# Ask for a new decision once the tank reaches another decision point
 		self.temp_decision_point = self.get_nearest_decision_point()
 		if isinstance(self.temp_decision_point, DecisionPoint) and isinstance(self.most_recent_decision_point, DecisionPoint) and self.temp_decision_point.get_index() != self.most_recent_decision_point.get_index():
 			self.awaiting_decision = True
@@ -72,37 +103,26 @@ class Tank:
 			self.shoot()
 
 		# Check for collisions with walls, eagles, and the other tank
-		if not self.check_collisions(new_x, new_y, self.game.map.bricks, self.game.map.steel_walls, self.game.map.eagles, opponent):
+		if not self.check_collisions(new_x, new_y, self.game.map.eagles, opponent):
 			if 0 <= new_x <= self.game.SCREEN_WIDTH - self.width and 0 <= new_y <= self.game.SCREEN_HEIGHT - self.height:
 				self.x, self.y = new_x, new_y
 
-	def check_collisions(self, new_x, new_y, bricks, steel_walls, eagles, opponent):
+	def check_collisions(self, new_x, new_y, eagles, opponent):
 		if self.destroyed:
 			return False
 
-		# Check collision with bricks
-		for brick in bricks:
-			if new_x < brick["x"] + self.game.TILE_SIZE and new_x + self.width > brick["x"] and new_y < brick["y"] + self.game.TILE_SIZE and new_y + self.height > brick["y"] and not brick["destroyed"]:
-				return True
-
-		# Check collision with bricks
-		for steel_wall in steel_walls:
-			if (
-				new_x < steel_wall["x"] + self.game.TILE_SIZE
-				and new_x + self.width > steel_wall["x"]
-				and new_y < steel_wall["y"] + self.game.TILE_SIZE
-				and new_y + self.height > steel_wall["y"]
-			):
-				return True
+		# Check collision with intact bricks and steel walls (only the tiles under the tank)
+		if self.game.map.box_hits(new_x, new_y, self.width, self.height):
+			return True
 
 		# Check collision with intact eagles
-		for eagle in eagles:
-			if not eagle["destroyed"]:
+		for index, (eagle_x, eagle_y) in enumerate(eagles.positions):
+			if not eagles.destroyed[index]:
 				if (
-					new_x < eagle["x"] + eagle["width"]
-					and new_x + self.width > eagle["x"]
-					and new_y < eagle["y"] + eagle["height"]
-					and new_y + self.height > eagle["y"]
+					new_x < eagle_x + eagles.size
+					and new_x + self.width > eagle_x
+					and new_y < eagle_y + eagles.size
+					and new_y + self.height > eagle_y
 				):
 					return True
 
@@ -119,7 +139,7 @@ class Tank:
 
 	def shoot(self):
 		"""Fire a bullet if allowed."""
-		current_time = pygame.time.get_ticks()
+		current_time = self.game.get_ticks()
 		if current_time - self.last_shot_time >= 500:  # Allow one shot every 500ms
 			self.last_shot_time = current_time
 
@@ -143,75 +163,13 @@ class Tank:
 			else:
 				return  # Invalid direction, do nothing
 
-			# Create a new bullet and append it to the bullets list
-			bullet = Bullet(self.game, bullet_x, bullet_y, velocity_x, velocity_y)
-			self.bullets.append(bullet)
+			self.game.bullet_pool.fire(self.index, bullet_x, bullet_y, velocity_x, velocity_y)
 
-	def update_bullets(self, bricks, steel_walls, eagles, enemy_tank, enemy_bullets):
-		if self.destroyed:
+	def update_bullets(self, enemy_tank):
+		# Bullets of a destroyed tank stay where they are
+		if self.destroyed or not self.game.bullet_pool.count[self.index]:
 			return
-
-		for bullet in self.bullets:
-			bullet_removed = False
-			bullet.update()
-			if bullet.is_off_screen():
-				self.bullets.remove(bullet)
-			else:
-				damage_bounds = bullet.create_damage_bounds()
-
-				# Tank
-				if not bullet_removed:
-					if bullet.collides_with_tank(enemy_tank):
-						bullet_removed = True
-						enemy_tank.destroy()
-				if bullet_removed:
-					self.bullets.remove(bullet)
-					break
-
-				# Eagle
-				if not bullet_removed:
-					for eagle in eagles:
-						if not eagle["destroyed"] and bullet.collides_with_eagle(eagle):
-							bullet_removed = True
-							eagle["destroyed"] = True
-				if bullet_removed:
-					self.bullets.remove(bullet)
-					break
-
-				# Bricks
-				if not bullet_removed:
-					for brick in bricks:
-						if not brick["destroyed"]:
-							if (
-								(damage_bounds["x"] <= brick["x"] < damage_bounds["x"] + damage_bounds["width"] and damage_bounds["y"] <= brick["y"] < damage_bounds["y"] + damage_bounds["height"]) or
-								(damage_bounds["x"] <= brick["x"] + self.game.TILE_SIZE < damage_bounds["x"] + damage_bounds["width"] and damage_bounds["y"] <= brick["y"] < damage_bounds["y"] + damage_bounds["height"]) or
-								(damage_bounds["x"] <= brick["x"] < damage_bounds["x"] + damage_bounds["width"] and damage_bounds["y"] <= brick["y"] + self.game.TILE_SIZE < damage_bounds["y"] + damage_bounds["height"]) or
-								(damage_bounds["x"] <= brick["x"] + self.game.TILE_SIZE < damage_bounds["x"] + damage_bounds["width"] and damage_bounds["y"] <= brick["y"] + self.game.TILE_SIZE < damage_bounds["y"] + damage_bounds["height"])
-							):
-								bullet_removed = True
-								brick["destroyed"] = True
-				if bullet_removed:
-					self.bullets.remove(bullet)
-					break
-
-				# Steel Wall
-				if not bullet_removed:
-					for steel_wall in steel_walls:
-						if bullet.collides_with(steel_wall):
-							bullet_removed = True
-				if bullet_removed:
-					self.bullets.remove(bullet)
-					break
-
-				# Enemy Bullet
-				if not bullet_removed:
-					for enemy_bullet in enemy_bullets:
-						if bullet.collides_with_bullet(enemy_bullet):
-							bullet_removed = True
-							enemy_bullets.remove(enemy_bullet)
-				if bullet_removed:
-					self.bullets.remove(bullet)
-					break
+		self.game.bullet_pool.update(self.index, enemy_tank)
 
 	def destroy(self):
 		self.destroyed = True
@@ -219,10 +177,7 @@ class Tank:
 	def get_nearest_decision_point(self):
 		tank_center_x = self.x + self.game.TANK_SIZE / 2
 		tank_center_y = self.y + self.game.TANK_SIZE / 2
-		for dp in self.game.map.decision_points:
-			if dp.is_near(tank_center_x, tank_center_y):
-				return dp
-		return False
+		return self.game.map.decision_point_near(tank_center_x, tank_center_y)
 
 	def get_normalized_xy_coordinates(self):
 		center_x = self.x + self.width / 2
@@ -231,45 +186,37 @@ class Tank:
 		norm_y = center_y / self.game.SCREEN_HEIGHT
 		return norm_x, norm_y
 
-	def get_direction_to_opponent_onehot(self):
+	def get_direction_to_opponent_sector(self):
 		dx = self.opponent.x - self.x
 		dy = self.opponent.y - self.y
 		angle = math.degrees(math.atan2(-dy, dx)) % 360
 
 		directions = ['E', 'NE', 'N', 'NW', 'W', 'SW', 'S', 'SE']
-		sector = int((angle + 22.5) // 45) % 8
+		return int((angle + 22.5) // 45) % 8
+
+	def get_direction_to_opponent_onehot(self):
+		sector = self.get_direction_to_opponent_sector()
 		onehot = [1 if i == sector else 0 for i in range(8)]
 		return onehot
 
 	def has_line_of_sight_to_opponent(self):
-		x1, y1 = self.x + self.width // 2, self.y + self.height // 2
 		x2, y2 = self.opponent.x + self.opponent.width // 2, self.opponent.y + self.opponent.height // 2
+		return self.has_line_of_sight_to(x2, y2)
 
-		# Only consider direct line-of-sight horizontally or vertically
-		if x1 == x2:
-			# Vertical check
-			step = 1 if y2 > y1 else -1
-			for y in range(int(y1), int(y2), int(step * self.game.TILE_SIZE)):
-				if self._obstacle_at(x1, y):
-					return 0.0
-			return 1.0
-
-		elif y1 == y2:
-			# Horizontal check
-			step = 1 if x2 > x1 else -1
-			for x in range(int(x1), int(x2), int(step * self.game.TILE_SIZE)):
-				if self._obstacle_at(x, y1):
-					return 0.0
-			return 1.0
-
-		return 0.0  # Not in a straight line
-
-	def _obstacle_at(self, x, y):
-		# Check for any wall or brick at this tile
-		for wall in self.game.map.bricks + self.game.map.steel_walls:
-			if wall.get("destroyed", False):
-				continue
-			wx, wy = wall["x"], wall["y"]
-			if wx <= x <= wx + self.game.TILE_SIZE and wy <= y <= wy + self.game.TILE_SIZE:
-				return True
-		return False
+	def has_line_of_sight_to_eagle(self, eagle=None):
+		# Clear shot along the tank's row or column at an eagle, the opponent's by default
+		eagle = eagle or self.opponent.eagle
+		x1, y1 = self.x + self.width // 2, self.y + self.height // 2
+		if eagle["x"] <= x1 < eagle["x"] + eagle["width"]:
+			return self.has_line_of_sight_to(x1, eagle["y"] + eagle["height"] // 2)
+		if eagle["y"] <= y1 < eagle["y"] + eagle["height"]:
+			return self.has_line_of_sight_to(eagle["x"] + eagle["width"] // 2, y1)
+		return 0.0
+
+	def has_line_of_sight_to(self, x2, y2):
+		# 1.0 when the point is straight up, down, left or right of the tank's center with no brick or
+		# steel in between (Map.line_clear, constant time)
+		x1, y1 = self.x + self.width // 2, self.y + self.height // 2
+		if x1 != x2 and y1 != y2:
+			return 0.0  # Not in a straight line
+		return 1.0 if self.game.map.line_clear(x1, y1, x2, y2) else 0.0
@@ -1,37 +1,203 @@
-from multiprocessing import Process, freeze_support
+from multiprocessing import Process, Pipe, freeze_support
 import time
+import math
 import os
-import subprocess  # ✅ to run the merge script after
 
+from checkpoint import save_atomically
+from profiling import PhaseTimer
+from shared_parameters import SharedParameterSlots, parameter_layout, parameters_to_vector, vector_to_parameters, vector_to_state_dicts
 
-def run_game_instance(instance_id, num_iterations=1):
+
+def available_cores():
+	# Cores this process may run on, not just the cores in the machine
+	if hasattr(os, "sched_getaffinity"):
+		return sorted(os.sched_getaffinity(0))
+	return list(range(os.cpu_count() or 1))
+
+
+def default_worker_count():
+	return len(available_cores())
+
+
+def plan_thread_budget(num_workers, pin_cores=False):
+	# Split the cores between workers: one torch thread for batch-1 decisions (the actor), the
+	# worker's share of cores for its train() passes (the learner), optionally pinned to those cores.
+	# Learners only get more threads than actors with fewer workers than cores; at the default
+	# worker count (one per core) both use a single thread.
+	cores = available_cores()
+	per_worker = max(1, len(cores) // num_workers)
+	plans = []
+	for worker_id in range(num_workers):
+		start = (worker_id * per_worker) % len(cores)
+		plans.append({
+			"actor_threads": 1,
+			"learner_threads": per_worker,
+			"interop_threads": 1,
+			"cores": cores[start:start + per_worker] if pin_cores else None,
+		})
+	return plans
+
+
+def apply_thread_plan(plan):
+	import torch
+	if plan["cores"] and hasattr(os, "sched_setaffinity"):
+		os.sched_setaffinity(0, plan["cores"])
+	torch.set_num_threads(plan["actor_threads"])
+	try:
+		torch.set_num_interop_threads(plan["interop_threads"])
+	except RuntimeError:
+		pass  # Only settable before torch's first parallel work, the forked worker may have inherited it
+
+
+def worker_loop(worker_id, connection, game_kwargs, thread_plan):
+	# Long-lived worker: imports and builds its Game once, then runs one quota per batch
+	apply_thread_plan(thread_plan)
 	from game import Game
-	agent1_file = f"policies/agent1_policy_{instance_id}.pth"
-	agent2_file = f"policies/agent2_policy_{instance_id}.pth"
-	game = Game(headless=True, agent1_file=agent1_file, agent2_file=agent2_file, max_iterations=num_iterations)
-	game.main()
+	game = Game(headless=True, persist_models=False, **game_kwargs)
+	game.actor_threads = thread_plan["actor_threads"]
+	game.learner_threads = thread_plan["learner_threads"]
+	game.init_game()
+
+	# Handshake: publish the parameter layout, receive the shared slots
+	connection.send({"layout": parameter_layout(game), "policy_name": game.policy_name, "startup_times": game.startup_times})
+	slots = connection.recv()
+
+	while True:
+		message = connection.recv()
+		if message is None:
+			break
+		iterations, load_average = message
+		if load_average:
+			vector_to_parameters(game, slots[-1])
+
+		start_tick = game.sim_tick
+		start_wall, start_cpu = time.time(), time.process_time()
+		game.running = True
+		game.iteration_limit = game.iteration + iterations
+		game.main()
+		parameters_to_vector(game, slots[worker_id])
+		connection.send({
+			"worker_id": worker_id,
+			"iterations": iterations,
+			"steps": game.sim_tick - start_tick,
+			"wall_seconds": time.time() - start_wall,
+			"cpu_seconds": time.process_time() - start_cpu,  # All threads of the worker
+			"phases": game.timer.phases if game.timer.enabled else None,  # With Game(instrument=True)
+		})
+		game.timer.reset()
+	connection.close()
+
+
+class WorkerPool:
+	"""Keeps num_workers training processes alive across batches.
+
+	Each batch sends the workers a quota of iterations over a pipe and waits for their results.
+	Weights go through shared memory instead: workers publish their parameters into their slot,
+	average() combines the slots and the next batch starts from the average.
+	"""
+
+	def __init__(self, num_workers=None, pin_cores=False, **game_kwargs):
+		self.num_workers = num_workers or default_worker_count()
+		self.thread_plans = plan_thread_budget(self.num_workers, pin_cores)
+		self.connections = []
+		self.processes = []
+		for worker_id in range(self.num_workers):
+			parent_connection, child_connection = Pipe()
+			process = Process(target=worker_loop, args=(worker_id, child_connection, game_kwargs, self.thread_plans[worker_id]), daemon=True)
+			process.start()
+			child_connection.close()
+			self.connections.append(parent_connection)
+			self.processes.append(process)
+
+		handshakes = [connection.recv() for connection in self.connections]
+		self.layout = handshakes[0]["layout"]
+		self.policy_name = handshakes[0]["policy_name"]
+		self.startup_times = [handshake["startup_times"] for handshake in handshakes]
+		size = sum(math.prod(shape) for _, _, shape in self.layout)
+		self.slots = SharedParameterSlots(self.num_workers, size)
+		for connection in self.connections:
+			connection.send(self.slots.slots)
+		self.has_average = False
+
+	def print_startup_times(self):
+		# Mean seconds per startup phase over the workers
+		phases = ", ".join(
+			f"{phase} {sum(times[phase] for times in self.startup_times) / len(self.startup_times):.3f}s"
+			for phase in self.startup_times[0]
+		)
+		print(f"⏱️ Worker startup: {phases}")
+
+	def print_phase_timings(self, results):
+		# Phase histograms of all workers for this batch, aggregated
+		timer = PhaseTimer()
+		for result in results:
+			if result["phases"]:
+				timer.merge(PhaseTimer.from_phases(result["phases"]))
+		if timer.phases:
+			timer.print_report(f"Phase timings over {len(results)} workers")
+
+	def print_utilization(self, results):
+		# CPU time over wall time per worker: 100% is one fully busy core
+		usage = ", ".join(
+			f"{result['worker_id']}: {100 * result['cpu_seconds'] / max(result['wall_seconds'], 1e-9):.0f}%"
+			for result in results
+		)
+		plan = self.thread_plans[0]
+		split = "" if plan["learner_threads"] > plan["actor_threads"] else ", no learner split with one worker per core"
+		print(f"🧮 CPU per worker ({plan['actor_threads']} actor / {plan['learner_threads']} learner threads{split}): {usage}")
+
+	def run_batch(self, iterations):
+		for connection in self.connections:
+			connection.send((iterations, self.has_average))
+		return [connection.recv() for connection in self.connections]
+
+	def average(self, results):
+		# Average the workers' parameters in place, weighted by the steps each collected
+		steps = [0] * self.num_workers
+		for result in results:
+			steps[result["worker_id"]] = result["steps"]
+		self.slots.average_slots(steps if sum(steps) else None)
+		self.has_average = True
+
+	def save_average(self):
+		# Write the average where Game and run_one pick up merged policies
+		for agent_name, state_dict in vector_to_state_dicts(self.layout, self.slots.average).items():
+			save_atomically(state_dict, f"policies/{agent_name}_{self.policy_name}_merged.pth")
+
+	def close(self):
+		for connection in self.connections:
+			connection.send(None)
+		for process in self.processes:
+			process.join()
 
 
 if __name__ == "__main__":
 	freeze_support()
 
-	num_instances = 50
+	num_instances = default_worker_count()  # Fewer workers than cores give each learner several threads
 	iterations_per_batch = 5
 	total_iterations = 300
+	pin_cores = False  # Pin each worker to its share of the cores
 
 	batches = total_iterations // iterations_per_batch
 
+	print(f"🚀 Starting {num_instances} workers...")
+	pool = WorkerPool(num_instances, pin_cores=pin_cores)
+	pool.print_startup_times()
+
 	for batch in range(batches):
 		print(f"\n🧠 Starting training batch {batch + 1}/{batches}...")
-		processes = []
-
-		for i in range(num_instances):
-			p = Process(target=run_game_instance, args=(i, iterations_per_batch))
-			p.start()
-			processes.append(p)
+		start = time.time()
+		results = pool.run_batch(iterations_per_batch)
+		steps = sum(result["steps"] for result in results)
+		print(f"⏱️ Batch took {time.time() - start:.1f}s ({steps} steps)")
+		pool.print_utilization(results)
+		pool.print_phase_timings(results)
 
-		for p in processes:
-			p.join()
+		print(f"🔀 Averaging policies after batch {batch + 1}...")
+		pool.average(results)
+		pool.save_average()  # Every batch, so an interrupted run keeps its latest average
+		print("💾 Saved merged models")
 
-		print(f"🔀 Merging policies after batch {batch + 1}...")
-		subprocess.run(["python", "merge_policies.py"])
+	print("✅ Training finished")
+	pool.close()
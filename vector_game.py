@@ -0,0 +1,48 @@
+from agent import decide_actions
+from game import Game
+
+
+class VectorGame:
+	"""Runs several headless games in one process, stepping them in lockstep.
+
+	The games share agent1's and agent2's networks and optimizers, so every frame the pending
+	decisions of all games go through one batched forward pass per network instead of one
+	pass per agent. Only the first game saves the models.
+	"""
+
+	def __init__(self, num_games=8, max_iterations=1, **game_kwargs):
+		self.primary = Game(headless=True, max_iterations=max_iterations, **game_kwargs)
+		self.games = [self.primary] + [
+			Game(headless=True, max_iterations=max_iterations, shared_with=self.primary, **game_kwargs)
+			for _ in range(num_games - 1)
+		]
+
+	def is_running(self, game):
+		return game.running and (game.iteration_limit is None or game.iteration < game.iteration_limit)
+
+	def main(self):
+		active = list(self.games)
+		while active:
+			pending = []
+			for game in active:
+				game.timeElapsed = game.get_time_elapsed()
+				pending += game.begin_update()
+
+			if pending:
+				started = self.primary.timer.start()
+				decide_actions(pending)
+				self.primary.timer.lap("decide", started)
+
+			for game in active:
+				game.end_update()
+				game.advance_clock()
+			active = [game for game in active if self.is_running(game)]
+
+		for game in self.games:
+			game.running = False
+		self.primary.finish_saving()
+
+
+if __name__ == "__main__":
+	vector_game = VectorGame(num_games=8, max_iterations=1)
+	vector_game.main()